@@ -1,10 +1,16 @@
 from __future__ import annotations
 
 import asyncio
+import heapq
 import logging
+import time
+from collections import OrderedDict, defaultdict
 from datetime import datetime
-from typing import Optional, List, Callable, Dict, Any, Awaitable
+from functools import lru_cache
+from typing import Optional, List, Tuple, Callable, Dict, Any, Awaitable, Hashable, Union
 
+from aiohttp import web
+from aiolimiter import AsyncLimiter
 from aiogram import Bot, Dispatcher, Router, F, BaseMiddleware
 from aiogram.filters import Command, CommandStart
 from aiogram.types import (
@@ -14,41 +20,100 @@ from aiogram.types import (
     InlineKeyboardButton, 
     TelegramObject,
     BufferedInputFile,
+    FSInputFile,
+    InputFile,
+    InputMediaPhoto,
     ReplyKeyboardMarkup,
     KeyboardButton
 )
 from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 import config
 from database import db, Server
-from monitor import check_server, check_ping, check_tcp_port, CheckResult
+from monitor import check_server, check_ping, check_tcp_port, CheckResult, AIMDLimiter
 from charts import (
     generate_uptime_chart,
     generate_all_servers_chart,
     generate_weekly_chart,
-    generate_realtime_status_image
+    get_dashboard_image,
+    prerender_dashboard,
+    invalidate_dashboard_cache,
+    shutdown_charts,
+    STATUS_IMAGE_EXT
 )
 
 # Настройка логирования
 logging.basicConfig(
-    level=logging.INFO,
+    level=config.LOG_LEVEL,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 logger = logging.getLogger(__name__)
 
+# Множество для O(1) проверки доступа на каждом апдейте
+_ADMIN_IDS: frozenset[int] = frozenset(config.ADMIN_IDS)
+
 # Инициализация
 bot = Bot(token=config.BOT_TOKEN)
 dp = Dispatcher()
 router = Router()
 
-# Состояние мониторинга
-monitoring_active = False
+# Состояние мониторинга: событие установлено, пока мониторинг запущен
+monitoring_event = asyncio.Event()
+# Сигнал остановки прерывает паузу между раундами
+monitoring_stop = asyncio.Event()
+# Пробуждение цикла вне расписания (добавлен или включён сервер)
+monitoring_wake = asyncio.Event()
+monitoring_task: Optional[asyncio.Task] = None
+
+# Общий адаптивный лимит одновременных проверок
+check_limiter = AIMDLimiter(config.MAX_CONCURRENT_CHECKS or 32)
+
+# Собственный таймаут проверки чуть меньше CHECK_TIMEOUT: молчащий UDP-порт
+# считается доступным только по истечении таймаута пробы, и внешний
+# wait_for не должен успеть оборвать её раньше
+PROBE_TIMEOUT = max(config.CHECK_TIMEOUT - 0.5, config.CHECK_TIMEOUT / 2)
+
+# Лимиты Telegram: 30 сообщений/сек всего и 1 сообщение/сек в один чат
+_overall_limiter = AsyncLimiter(30, 1)
+_chat_limiters: Dict[int, AsyncLimiter] = defaultdict(lambda: AsyncLimiter(1, 1))
+
+# Не больше 10 записей о запрете доступа в минуту
+_denied_log_limiter = AsyncLimiter(10, 60)
+
+# Хэш последнего отрисованного содержимого: (chat_id, message_id) -> hash
+_rendered_messages: OrderedDict[Tuple[int, int], int] = OrderedDict()
+_RENDERED_MESSAGES_SIZE = 1024
+
+# file_id уже загруженных в Telegram картинок: ключ картинки -> file_id
+_photo_file_ids: OrderedDict[Hashable, str] = OrderedDict()
+_PHOTO_FILE_IDS_SIZE = 256
 
 
 # ============= MIDDLEWARE ДЛЯ ПРОВЕРКИ ДОСТУПА =============
 
+async def _deny_message(event: Message):
+    await event.answer(
+        "⛔ <b>Доступ запрещён</b>\n\n"
+        "Этот бот работает только для авторизованных пользователей.",
+        parse_mode=ParseMode.HTML
+    )
+
+
+async def _deny_callback(event: CallbackQuery):
+    await event.answer("⛔ Доступ запрещён", show_alert=True)
+
+
+# Ответ на запрет доступа по типу события; остальные типы пропускаются без проверки
+_ACCESS_DENIERS: Dict[type, Callable[[Any], Awaitable[None]]] = {
+    Message: _deny_message,
+    CallbackQuery: _deny_callback
+}
+
+
 class AccessMiddleware(BaseMiddleware):
     """Middleware для проверки доступа к боту"""
     
@@ -58,25 +123,18 @@ class AccessMiddleware(BaseMiddleware):
         event: TelegramObject,
         data: Dict[str, Any]
     ) -> Any:
-        user_id = None
+        deny = _ACCESS_DENIERS.get(type(event))
+        if deny is None:
+            return await handler(event, data)
         
-        if isinstance(event, Message):
-            user_id = event.from_user.id
-        elif isinstance(event, CallbackQuery):
-            user_id = event.from_user.id
+        user_id = event.from_user.id
         
-        if user_id and user_id not in config.ADMIN_IDS:
-            logger.warning(f"⛔ Unauthorized access from user_id={user_id}")
-            
-            if isinstance(event, Message):
-                await event.answer(
-                    "⛔ <b>Доступ запрещён</b>\n\n"
-                    "Этот бот работает только для авторизованных пользователей.",
-                    parse_mode=ParseMode.HTML
-                )
-            elif isinstance(event, CallbackQuery):
-                await event.answer("⛔ Доступ запрещён", show_alert=True)
-            
+        if user_id not in _ADMIN_IDS:
+            # Ограничиваем запись в лог, чтобы спам не забивал диск
+            if _denied_log_limiter.has_capacity():
+                await _denied_log_limiter.acquire()
+                logger.warning("⛔ Unauthorized access from user_id=%s", user_id)
+            await deny(event)
             return
         
         return await handler(event, data)
@@ -100,23 +158,26 @@ class AddServerState(StatesGroup):
 
 def is_admin(user_id: int) -> bool:
     """Проверка является ли пользователь админом"""
-    return user_id in config.ADMIN_IDS
+    return user_id in _ADMIN_IDS
 
 
-def get_status_emoji(is_available: bool) -> str:
-    return "🟢" if is_available else "🔴"
+@lru_cache(maxsize=1024)
+def _format_minute(minute: int) -> str:
+    return datetime.fromtimestamp(minute * 60).strftime("%Y-%m-%d %H:%M")
 
 
-def get_main_keyboard() -> ReplyKeyboardMarkup:
-    """Основная Reply-клавиатура с динамической кнопкой мониторинга"""
-    
-    # Выбираем кнопку в зависимости от состояния мониторинга
-    if monitoring_active:
-        monitoring_btn = KeyboardButton(text="⏹ Стоп мониторинга")
-    else:
-        monitoring_btn = KeyboardButton(text="▶️ Старт мониторинга")
-    
-    keyboard = ReplyKeyboardMarkup(
+def format_timestamp(ts: int) -> str:
+    """Unix time -> 'YYYY-MM-DD HH:MM:SS' (форматирование кэшируется по минутам)"""
+    return f"{_format_minute(ts // 60)}:{ts % 60:02d}"
+
+
+# Индексируется bool-статусом: False -> 🔴, True -> 🟢
+_STATUS_EMOJI = ("🔴", "🟢")
+
+
+def _build_main_keyboard(monitoring_btn_text: str) -> ReplyKeyboardMarkup:
+    """Построение основной Reply-клавиатуры"""
+    return ReplyKeyboardMarkup(
         keyboard=[
             [
                 KeyboardButton(text="📋 Серверы"),
@@ -127,7 +188,7 @@ def get_main_keyboard() -> ReplyKeyboardMarkup:
                 KeyboardButton(text="📈 Дашборд")
             ],
             [
-                monitoring_btn
+                KeyboardButton(text=monitoring_btn_text)
             ],
             [
                 KeyboardButton(text="🏠 Главное меню")
@@ -136,49 +197,85 @@ def get_main_keyboard() -> ReplyKeyboardMarkup:
         resize_keyboard=True,
         is_persistent=True
     )
-    return keyboard
 
-def get_server_keyboard(server: Server) -> InlineKeyboardMarkup:
-    """Клавиатура для управления сервером"""
-    status_text = "⏸ Отключить" if server.is_active else "▶️ Включить"
+
+# Клавиатуры строятся один раз при импорте
+_KB_RUNNING = _build_main_keyboard("⏹ Стоп мониторинга")
+_KB_STOPPED = _build_main_keyboard("▶️ Старт мониторинга")
+
+
+def get_main_keyboard() -> ReplyKeyboardMarkup:
+    """Основная Reply-клавиатура с динамической кнопкой мониторинга"""
+    return _KB_RUNNING if monitoring_event.is_set() else _KB_STOPPED
+
+_ADD_SERVER_BUTTON = InlineKeyboardButton(text="➕ Добавить сервер", callback_data="add_server")
+_ADD_SERVER_KB = InlineKeyboardMarkup(inline_keyboard=[[_ADD_SERVER_BUTTON]])
+
+
+@lru_cache(maxsize=512)
+def _server_keyboard(server_id: int, is_active: bool) -> InlineKeyboardMarkup:
+    status_text = "⏸ Отключить" if is_active else "▶️ Включить"
     
     buttons = [
         [
-            InlineKeyboardButton(text="🔍 Проверить", callback_data=f"check_{server.id}"),
-            InlineKeyboardButton(text="📊 Статистика", callback_data=f"stats_{server.id}")
+            InlineKeyboardButton(text="🔍 Проверить", callback_data=f"check_{server_id}"),
+            InlineKeyboardButton(text="📊 Статистика", callback_data=f"stats_{server_id}")
         ],
         [
-            InlineKeyboardButton(text="📈 График", callback_data=f"chart_24h_{server.id}"),
-            InlineKeyboardButton(text=status_text, callback_data=f"toggle_{server.id}")
+            InlineKeyboardButton(text="📈 График", callback_data=f"chart_24h_{server_id}"),
+            InlineKeyboardButton(text=status_text, callback_data=f"toggle_{server_id}")
         ],
         [
-            InlineKeyboardButton(text="🗑 Удалить", callback_data=f"delete_{server.id}"),
+            InlineKeyboardButton(text="🗑 Удалить", callback_data=f"delete_{server_id}"),
             InlineKeyboardButton(text="◀️ Назад", callback_data="list_servers")
         ]
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_servers_list_keyboard(servers: List[Server]) -> InlineKeyboardMarkup:
-    """Клавиатура со списком серверов"""
+def get_server_keyboard(server: Server) -> InlineKeyboardMarkup:
+    """Клавиатура для управления сервером"""
+    return _server_keyboard(server.id, server.is_active)
+
+
+@lru_cache(maxsize=32)
+def _servers_list_keyboard(
+    rows: Tuple[Tuple[int, bool, bool, str, str, int], ...]
+) -> InlineKeyboardMarkup:
     buttons = []
     
-    for server in servers:
-        status = get_status_emoji(server.last_status) if server.is_active else "⏸"
+    for server_id, is_active, last_status, name, host, port in rows:
+        status = _STATUS_EMOJI[last_status] if is_active else "⏸"
         buttons.append([
             InlineKeyboardButton(
-                text=f"{status} {server.name} ({server.host}:{server.port})",
-                callback_data=f"server_{server.id}"
+                text=f"{status} {name} ({host}:{port})",
+                callback_data=f"server_{server_id}"
             )
         ])
     
-    buttons.append([
-        InlineKeyboardButton(text="➕ Добавить сервер", callback_data="add_server")
-    ])
+    buttons.append([_ADD_SERVER_BUTTON])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+def get_servers_list_keyboard(servers: List[Server]) -> InlineKeyboardMarkup:
+    """
+    Клавиатура со списком серверов.
+    Кэшируется по отображаемым полям, поэтому инвалидация не нужна.
+    """
+    return _servers_list_keyboard(tuple(
+        (s.id, s.is_active, s.last_status, s.name, s.host, s.port)
+        for s in servers
+    ))
+
+
+async def send_message(chat_id: int, text: str, **kwargs) -> Message:
+    """Отправка сообщения с соблюдением лимитов Telegram"""
+    async with _chat_limiters[chat_id]:
+        async with _overall_limiter:
+            return await bot.send_message(chat_id=chat_id, text=text, **kwargs)
+
+
 async def safe_edit_or_send(
     callback: CallbackQuery,
     text: str,
@@ -187,47 +284,128 @@ async def safe_edit_or_send(
 ):
     """
     Безопасное редактирование сообщения.
+    Если содержимое не изменилось - ничего не делает.
     Если сообщение - фото или редактирование не удалось, 
     удаляет и отправляет новое.
     """
-    if callback.message.photo or callback.message.document:
+    message = callback.message
+    key = (message.chat.id, message.message_id)
+    digest = hash((text, repr(reply_markup)))
+    
+    if _rendered_messages.get(key) == digest:
+        return
+    
+    if message.photo or message.document:
         try:
-            await callback.message.delete()
+            await message.delete()
         except Exception:
             pass
-        await callback.message.answer(
+        sent = await message.answer(
             text, 
             parse_mode=parse_mode, 
             reply_markup=reply_markup
         )
+        _remember_rendered((sent.chat.id, sent.message_id), digest)
         return
     
     try:
-        await callback.message.edit_text(
-            text, 
-            parse_mode=parse_mode, 
-            reply_markup=reply_markup
-        )
-    except Exception:
-        try:
-            await callback.message.delete()
-        except Exception:
-            pass
-        await callback.message.answer(
+        await message.edit_text(
             text, 
             parse_mode=parse_mode, 
             reply_markup=reply_markup
         )
+    except Exception as e:
+        # "message is not modified" - содержимое уже актуально
+        if not (isinstance(e, TelegramBadRequest) and "message is not modified" in e.message):
+            try:
+                await message.delete()
+            except Exception:
+                pass
+            sent = await message.answer(
+                text, 
+                parse_mode=parse_mode, 
+                reply_markup=reply_markup
+            )
+            _remember_rendered((sent.chat.id, sent.message_id), digest)
+            return
+    
+    _remember_rendered(key, digest)
 
 
-# ============= Команды =============
+def _image_key(image: bytes) -> Tuple[int, int]:
+    """Ключ PNG для кэша file_id (хэш bytes вычисляется один раз)"""
+    return len(image), hash(image)
 
-@router.message(CommandStart())
-async def cmd_start(message: Message):
-    """Обработчик /start"""
-    await db.add_subscriber(message.chat.id)
+
+def _cached_photo(key: Optional[Hashable], photo: InputFile) -> Union[str, InputFile]:
+    """file_id уже загруженной картинки или сама картинка"""
+    return _photo_file_ids.get(key, photo) if key is not None else photo
+
+
+def _remember_photo(key: Optional[Hashable], sent: Any):
+    """Запомнить file_id отправленной картинки"""
+    if key is None or not isinstance(sent, Message) or not sent.photo:
+        return
+    _photo_file_ids[key] = sent.photo[-1].file_id
+    _photo_file_ids.move_to_end(key)
+    while len(_photo_file_ids) > _PHOTO_FILE_IDS_SIZE:
+        _photo_file_ids.popitem(last=False)
+
+
+async def safe_edit_or_send_photo(
+    callback: CallbackQuery,
+    photo: InputFile,
+    caption: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None,
+    parse_mode: str = ParseMode.HTML,
+    cache_key: Optional[Hashable] = None
+):
+    """
+    Показать фото на месте сообщения.
+    Фото заменяется через edit_media одним запросом,
+    текстовое сообщение удаляется и отправляется новое.
+    Картинка с известным cache_key повторно не загружается - используется file_id.
+    """
+    message = callback.message
+    media = _cached_photo(cache_key, photo)
     
-    text = """
+    if message.photo:
+        try:
+            sent = await message.edit_media(
+                media=InputMediaPhoto(media=media, caption=caption, parse_mode=parse_mode),
+                reply_markup=reply_markup
+            )
+            _rendered_messages.pop((message.chat.id, message.message_id), None)
+            _remember_photo(cache_key, sent)
+            return
+        except TelegramBadRequest as e:
+            if "message is not modified" in e.message:
+                return
+            logger.debug("edit_media failed, resending: %s", e.message)
+    
+    try:
+        await message.delete()
+    except Exception:
+        pass
+    sent = await message.answer_photo(
+        photo=media,
+        caption=caption,
+        parse_mode=parse_mode,
+        reply_markup=reply_markup
+    )
+    _remember_photo(cache_key, sent)
+
+
+def _remember_rendered(key: Tuple[int, int], digest: int):
+    _rendered_messages[key] = digest
+    _rendered_messages.move_to_end(key)
+    while len(_rendered_messages) > _RENDERED_MESSAGES_SIZE:
+        _rendered_messages.popitem(last=False)
+
+
+# ============= Шаблоны сообщений =============
+
+START_TEXT = """
 🔐 <b>VPN Monitor Bot</b>
 
 Я слежу за доступностью ваших VPN-серверов и уведомляю о проблемах.
@@ -249,9 +427,104 @@ async def cmd_start(message: Message):
 <b>📈 Информация:</b>
 /stats - общая статистика
 """
+
+_STATUS_TMPL = """
+📊 <b>Общий статус</b>
+
+🔄 Мониторинг: {mon_status}
+
+📋 Серверов всего: {total}
+✅ Активных: {active}
+🟢 Онлайн: {online}
+🔴 Оффлайн: {offline}
+
+⏱ Интервал проверки: {interval} сек
+⚠️ Порог уведомления: {threshold} попыток
+"""
+
+_STATS_TMPL = """
+📊 <b>Общая статистика</b>
+
+📋 Всего серверов: {servers}
+📈 Всего проверок: {checks}
+✅ Успешных: {successes}
+❌ Неудачных: {failures}
+📊 Средняя доступность: {uptime}
+
+<b>По серверам:</b>
+
+{by_server}"""
+
+_STATS_ROW = "{status} {name}: {uptime}"
+
+_SERVER_INFO_TMPL = """
+🖥 <b>{name}</b>
+
+📍 Адрес: <code>{host}:{port}</code>
+📡 Протокол: {protocol}
+📊 Статус: {status}
+🔄 Мониторинг: {active_status}
+
+📈 <b>Статистика:</b>
+• Всего проверок: {checks}
+• Неудачных: {failures}
+• Доступность: {uptime}
+• Ошибок подряд: {consecutive}
+
+⏰ Последняя проверка: {last_check}
+"""
+
+_SERVER_STATS_TMPL = """
+📊 <b>Статистика: {name}</b>
+
+📈 Общая статистика:
+• Всего проверок: {checks}
+• Успешных: {successes}
+• Неудачных: {failures}
+• Доступность: {uptime}
+
+📜 История (смена статуса или каждая {sample}-я проверка):
+{history}"""
+
+_HISTORY_ROW = "{status} {time} {response}{repeat}\n"
+
+_DOWN_TMPL = """
+🚨🚨🚨 <b>СЕРВЕР НЕДОСТУПЕН!</b> 🚨🚨🚨
+
+📛 Сервер: <b>{name}</b>
+📍 Адрес: <code>{host}:{port}</code>
+📡 Протокол: {protocol}
+
+❌ Ошибка: {error}
+⚠️ Неудачных попыток: {failures}
+⏰ Время: {time}
+
+<b>Требуется проверка!</b>
+"""
+
+_RECOVERY_TMPL = """
+✅✅✅ <b>СЕРВЕР ВОССТАНОВЛЕН!</b> ✅✅✅
+
+📛 Сервер: <b>{name}</b>
+📍 Адрес: <code>{host}:{port}</code>
+📡 Протокол: {protocol}
+
+⏱ Время отклика: {response}
+⏰ Время: {time}
+
+<b>Сервер работает нормально.</b>
+"""
+
+
+# ============= Команды =============
+
+@router.message(CommandStart())
+async def cmd_start(message: Message):
+    """Обработчик /start"""
+    await db.add_subscriber(message.chat.id)
     
     await message.answer(
-        text, 
+        START_TEXT, 
         parse_mode=ParseMode.HTML,
         reply_markup=get_main_keyboard()
     )
@@ -412,7 +685,7 @@ async def process_server_port(message: Message, state: FSMContext):
 @router.callback_query(F.data.startswith("protocol_"))
 async def process_protocol(callback: CallbackQuery, state: FSMContext):
     """Обработка выбора протокола"""
-    protocol = callback.data.split("_")[1]
+    protocol = callback.data.rpartition("_")[2]
     data = await state.get_data()
     
     server_id = await db.add_server(
@@ -425,6 +698,7 @@ async def process_protocol(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     
     if server_id:
+        monitoring_wake.set()
         text = (
             f"✅ <b>Сервер успешно добавлен!</b>\n\n"
             f"📛 Название: {data['name']}\n"
@@ -443,26 +717,26 @@ async def process_protocol(callback: CallbackQuery, state: FSMContext):
 async def cmd_status(message: Message):
     """Общий статус"""
     servers = await db.get_all_servers()
-    active_servers = [s for s in servers if s.is_active]
     
-    online = sum(1 for s in active_servers if s.last_status)
-    offline = len(active_servers) - online
-    
-    mon_status = "🟢 Работает" if monitoring_active else "🔴 Остановлен"
-    
-    text = f"""
-📊 <b>Общий статус</b>
-
-🔄 Мониторинг: {mon_status}
-
-📋 Серверов всего: {len(servers)}
-✅ Активных: {len(active_servers)}
-🟢 Онлайн: {online}
-🔴 Оффлайн: {offline}
-
-⏱ Интервал проверки: {config.CHECK_INTERVAL} сек
-⚠️ Порог уведомления: {config.FAIL_THRESHOLD} попыток
-"""
+    # Один проход по списку
+    active = online = 0
+    for s in servers:
+        if s.is_active:
+            active += 1
+            online += s.last_status
+    offline = active - online
+    
+    mon_status = "🟢 Работает" if monitoring_event.is_set() else "🔴 Остановлен"
+    
+    text = _STATUS_TMPL.format_map({
+        "mon_status": mon_status,
+        "total": len(servers),
+        "active": active,
+        "online": online,
+        "offline": offline,
+        "interval": config.CHECK_INTERVAL,
+        "threshold": config.FAIL_THRESHOLD
+    })
     await message.answer(text, parse_mode=ParseMode.HTML, reply_markup=get_main_keyboard())
 
 
@@ -480,19 +754,20 @@ async def cmd_check_all(message: Message):
     
     msg = await message.answer(f"🔍 Проверяю {len(servers)} серверов...")
     
+    results = await asyncio.gather(*(probe_server(s) for s in servers))
+    probes = list(zip(servers, results))
+    
+    await db.update_server_status_many([
+        (server.id, result.is_available, result.response_time, result.error)
+        for server, result in probes
+    ])
+    invalidate_dashboard_cache()
+    
     results = []
-    for server in servers:
-        result = await check_server(server.host, server.port, server.protocol)
-        status = get_status_emoji(result.is_available)
+    for server, result in probes:
+        status = _STATUS_EMOJI[result.is_available]
         response = f"{result.response_time:.0f}ms" if result.response_time else "N/A"
         results.append(f"{status} {server.name} - {response}")
-        
-        await db.update_server_status(
-            server.id,
-            result.is_available,
-            result.response_time,
-            result.error
-        )
     
     text = "🔍 <b>Результаты проверки:</b>\n\n"
     text += "\n".join(results)
@@ -503,13 +778,13 @@ async def cmd_check_all(message: Message):
 @router.message(Command("startmon"))
 async def cmd_start_monitoring(message: Message):
     """Запуск мониторинга"""
-    global monitoring_active
+    global monitoring_task
     
     if not is_admin(message.from_user.id):
         await message.answer("⛔ У вас нет прав для управления мониторингом.")
         return
     
-    if monitoring_active:
+    if monitoring_event.is_set():
         await message.answer("⚠️ Мониторинг уже запущен!", reply_markup=get_main_keyboard())
         return
     
@@ -521,8 +796,12 @@ async def cmd_start_monitoring(message: Message):
         )
         return
     
-    monitoring_active = True
-    asyncio.create_task(monitoring_loop())
+    monitoring_stop.clear()
+    monitoring_event.set()
+    
+    # Предыдущий цикл мог ещё не завершиться после быстрого стоп/старт
+    if monitoring_task is None or monitoring_task.done():
+        monitoring_task = asyncio.create_task(monitoring_loop())
     
     await message.answer(
         f"✅ <b>Мониторинг запущен!</b>\n\n"
@@ -537,17 +816,16 @@ async def cmd_start_monitoring(message: Message):
 @router.message(Command("stopmon"))
 async def cmd_stop_monitoring(message: Message):
     """Остановка мониторинга"""
-    global monitoring_active
-    
     if not is_admin(message.from_user.id):
         await message.answer("⛔ У вас нет прав для управления мониторингом.")
         return
     
-    if not monitoring_active:
+    if not monitoring_event.is_set():
         await message.answer("⚠️ Мониторинг не запущен!", reply_markup=get_main_keyboard())
         return
     
-    monitoring_active = False
+    monitoring_event.clear()
+    monitoring_stop.set()
     await message.answer("🛑 Мониторинг остановлен!", reply_markup=get_main_keyboard())
 
 
@@ -560,31 +838,35 @@ async def cmd_stats(message: Message):
         await message.answer("📭 Нет серверов для статистики.", reply_markup=get_main_keyboard())
         return
     
-    total_checks = sum(s.total_checks for s in servers)
-    total_failures = sum(s.total_failures for s in servers)
+    # Итоги и строки по серверам за один проход
+    total_checks = total_failures = 0
+    rows = []
+    for server in servers:
+        total_checks += server.total_checks
+        total_failures += server.total_failures
+        
+        srv_uptime = "N/A"
+        if server.total_checks > 0:
+            srv_uptime = f"{server.uptime_pct:.0f}%"
+        
+        rows.append(_STATS_ROW.format_map({
+            "status": _STATUS_EMOJI[server.last_status] if server.is_active else "⏸",
+            "name": server.name,
+            "uptime": srv_uptime
+        }))
     
     uptime = "N/A"
     if total_checks > 0:
         uptime = f"{((total_checks - total_failures) / total_checks) * 100:.1f}%"
     
-    text = f"""
-📊 <b>Общая статистика</b>
-
-📋 Всего серверов: {len(servers)}
-📈 Всего проверок: {total_checks}
-✅ Успешных: {total_checks - total_failures}
-❌ Неудачных: {total_failures}
-📊 Средняя доступность: {uptime}
-
-<b>По серверам:</b>
-"""
-    
-    for server in servers:
-        srv_uptime = "N/A"
-        if server.total_checks > 0:
-            srv_uptime = f"{((server.total_checks - server.total_failures) / server.total_checks) * 100:.0f}%"
-        status = get_status_emoji(server.last_status) if server.is_active else "⏸"
-        text += f"\n{status} {server.name}: {srv_uptime}"
+    text = _STATS_TMPL.format_map({
+        "servers": len(servers),
+        "checks": total_checks,
+        "successes": total_checks - total_failures,
+        "failures": total_failures,
+        "uptime": uptime,
+        "by_server": "\n".join(rows)
+    })
     
     await message.answer(text, parse_mode=ParseMode.HTML, reply_markup=get_main_keyboard())
 
@@ -618,9 +900,7 @@ async def callback_list_servers(callback: CallbackQuery):
     
     if not servers:
         text = "📭 Список серверов пуст.\n\nИспользуйте /add для добавления."
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="➕ Добавить сервер", callback_data="add_server")]
-        ])
+        keyboard = _ADD_SERVER_KB
     else:
         text = "📋 <b>Список серверов:</b>\n\n<i>Нажмите на сервер для управления</i>"
         keyboard = get_servers_list_keyboard(servers)
@@ -652,37 +932,34 @@ async def callback_add_server(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data.startswith("server_"))
 async def callback_server_info(callback: CallbackQuery):
     """Информация о сервере"""
-    server_id = int(callback.data.split("_")[1])
+    server_id = int(callback.data.rpartition("_")[2])
     server = await db.get_server(server_id)
     
     if not server:
         await callback.answer("Сервер не найден", show_alert=True)
         return
     
-    status = get_status_emoji(server.last_status) if server.is_active else "⏸ Отключен"
+    status = _STATUS_EMOJI[server.last_status] if server.is_active else "⏸ Отключен"
     active_status = "✅ Активен" if server.is_active else "⏸ Отключен"
     last_check = server.last_check if server.last_check else "Не проверялся"
     
     uptime = "N/A"
     if server.total_checks > 0:
-        uptime = f"{((server.total_checks - server.total_failures) / server.total_checks) * 100:.1f}%"
-    
-    text = f"""
-🖥 <b>{server.name}</b>
-
-📍 Адрес: <code>{server.host}:{server.port}</code>
-📡 Протокол: {server.protocol.upper()}
-📊 Статус: {status}
-🔄 Мониторинг: {active_status}
-
-📈 <b>Статистика:</b>
-• Всего проверок: {server.total_checks}
-• Неудачных: {server.total_failures}
-• Доступность: {uptime}
-• Ошибок подряд: {server.consecutive_failures}
-
-⏰ Последняя проверка: {last_check}
-"""
+        uptime = f"{server.uptime_pct:.1f}%"
+    
+    text = _SERVER_INFO_TMPL.format_map({
+        "name": server.name,
+        "host": server.host,
+        "port": server.port,
+        "protocol": server.protocol.upper(),
+        "status": status,
+        "active_status": active_status,
+        "checks": server.total_checks,
+        "failures": server.total_failures,
+        "uptime": uptime,
+        "consecutive": server.consecutive_failures,
+        "last_check": last_check
+    })
     
     await safe_edit_or_send(callback, text, get_server_keyboard(server))
     await callback.answer()
@@ -691,7 +968,7 @@ async def callback_server_info(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("check_"))
 async def callback_check_server(callback: CallbackQuery):
     """Проверить сервер"""
-    server_id = int(callback.data.split("_")[1])
+    server_id = int(callback.data.rpartition("_")[2])
     server = await db.get_server(server_id)
     
     if not server:
@@ -700,9 +977,9 @@ async def callback_check_server(callback: CallbackQuery):
     
     await callback.answer("🔍 Проверяю...")
     
-    result = await check_server(server.host, server.port, server.protocol)
+    result = await check_server(server.host, server.port, server.protocol, PROBE_TIMEOUT)
     
-    status = get_status_emoji(result.is_available)
+    status = _STATUS_EMOJI[result.is_available]
     response_time = f"{result.response_time:.1f}ms" if result.response_time else "N/A"
     
     text = f"""
@@ -716,15 +993,13 @@ async def callback_check_server(callback: CallbackQuery):
 {"❌ Ошибка: " + result.error if result.error and not result.is_available else ""}
 """
     
-    await db.update_server_status(
+    updated_server = await db.update_server_status_returning(
         server_id,
         result.is_available,
         result.response_time,
         result.error
     )
-    
-    updated_server = await db.get_server(server_id)
-    await safe_edit_or_send(callback, text, get_server_keyboard(updated_server))
+    await safe_edit_or_send(callback, text, get_server_keyboard(updated_server or server))
 
 
 @router.callback_query(F.data.startswith("toggle_"))
@@ -734,13 +1009,16 @@ async def callback_toggle_server(callback: CallbackQuery):
         await callback.answer("⛔ У вас нет прав", show_alert=True)
         return
     
-    server_id = int(callback.data.split("_")[1])
+    server_id = int(callback.data.rpartition("_")[2])
     new_status = await db.toggle_server(server_id)
     
     if new_status is None:
         await callback.answer("Сервер не найден", show_alert=True)
         return
     
+    if new_status:
+        monitoring_wake.set()
+    
     status_text = "включен" if new_status else "отключен"
     await callback.answer(f"Мониторинг {status_text}")
     
@@ -755,7 +1033,7 @@ async def callback_delete_server(callback: CallbackQuery):
         await callback.answer("⛔ У вас нет прав", show_alert=True)
         return
     
-    server_id = int(callback.data.split("_")[1])
+    server_id = int(callback.data.rpartition("_")[2])
     server = await db.get_server(server_id)
     
     if not server:
@@ -782,7 +1060,7 @@ async def callback_delete_server(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("confirm_delete_"))
 async def callback_confirm_delete(callback: CallbackQuery):
     """Подтверждение удаления"""
-    server_id = int(callback.data.split("_")[2])
+    server_id = int(callback.data.rpartition("_")[2])
     
     if await db.remove_server(server_id):
         await callback.answer("✅ Сервер удалён")
@@ -793,9 +1071,7 @@ async def callback_confirm_delete(callback: CallbackQuery):
             keyboard = get_servers_list_keyboard(servers)
         else:
             text = "📭 Список серверов пуст."
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="➕ Добавить сервер", callback_data="add_server")]
-            ])
+            keyboard = _ADD_SERVER_KB
         
         await safe_edit_or_send(callback, text, keyboard)
     else:
@@ -805,36 +1081,38 @@ async def callback_confirm_delete(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("stats_"))
 async def callback_server_stats(callback: CallbackQuery):
     """Статистика сервера"""
-    server_id = int(callback.data.split("_")[1])
+    server_id = int(callback.data.rpartition("_")[2])
     server = await db.get_server(server_id)
     
     if not server:
         await callback.answer("Сервер не найден", show_alert=True)
         return
     
-    history = await db.get_server_history(server_id, limit=10)
+    history = await db.get_recent_checks(server_id, limit=5)
     
     uptime = "N/A"
     if server.total_checks > 0:
-        uptime = f"{((server.total_checks - server.total_failures) / server.total_checks) * 100:.1f}%"
-    
-    text = f"""
-📊 <b>Статистика: {server.name}</b>
-
-📈 Общая статистика:
-• Всего проверок: {server.total_checks}
-• Успешных: {server.total_checks - server.total_failures}
-• Неудачных: {server.total_failures}
-• Доступность: {uptime}
-
-📜 Последние проверки:
-"""
+        uptime = f"{server.uptime_pct:.1f}%"
+    
+    history_rows = "".join(
+        _HISTORY_ROW.format_map({
+            "status": "✅" if is_available else "❌",
+            "time": format_timestamp(checked_at) if checked_at else "N/A",
+            "response": f"{response_time:.0f}ms" if response_time else "",
+            "repeat": f" ×{checks}" if checks > 1 else ""
+        })
+        for is_available, response_time, checked_at, checks in history
+    )
     
-    for h in history[:5]:
-        status = "✅" if h["is_available"] else "❌"
-        time_str = h["checked_at"][:19] if h["checked_at"] else "N/A"
-        response = f"{h['response_time']:.0f}ms" if h["response_time"] else ""
-        text += f"{status} {time_str} {response}\n"
+    text = _SERVER_STATS_TMPL.format_map({
+        "name": server.name,
+        "checks": server.total_checks,
+        "successes": server.total_checks - server.total_failures,
+        "failures": server.total_failures,
+        "uptime": uptime,
+        "sample": max(1, config.HISTORY_SAMPLE_EVERY),
+        "history": history_rows
+    })
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -855,7 +1133,7 @@ async def callback_reset_stats(callback: CallbackQuery):
         await callback.answer("⛔ У вас нет прав", show_alert=True)
         return
     
-    server_id = int(callback.data.split("_")[2])
+    server_id = int(callback.data.rpartition("_")[2])
     await db.reset_server_stats(server_id)
     await callback.answer("✅ Статистика сброшена")
     
@@ -865,6 +1143,66 @@ async def callback_reset_stats(callback: CallbackQuery):
 
 # ============= Команды для графиков =============
 
+_CHART_ALL_ROW = [InlineKeyboardButton(text="📊 Все серверы", callback_data="chart_all")]
+
+
+@lru_cache(maxsize=2048)
+def _chart_kb(server_id: int, hours: int) -> InlineKeyboardMarkup:
+    """Клавиатура под графиком сервера"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="6ч", callback_data=f"chart_6h_{server_id}"),
+            InlineKeyboardButton(text="12ч", callback_data=f"chart_12h_{server_id}"),
+            InlineKeyboardButton(text="24ч", callback_data=f"chart_24h_{server_id}"),
+        ],
+        [
+            InlineKeyboardButton(text="📅 Неделя", callback_data=f"chart_week_{server_id}"),
+            InlineKeyboardButton(text="🔄 Обновить", callback_data=f"chart_{hours}h_{server_id}"),
+        ],
+        [InlineKeyboardButton(text="◀️ Назад", callback_data="list_servers")]
+    ])
+
+
+@lru_cache(maxsize=1024)
+def _weekly_kb(server_id: int) -> InlineKeyboardMarkup:
+    """Клавиатура под недельным графиком"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="📊 24 часа", callback_data=f"chart_24h_{server_id}"),
+            InlineKeyboardButton(text="🔄 Обновить", callback_data=f"chart_week_{server_id}"),
+        ],
+        [InlineKeyboardButton(text="◀️ Назад", callback_data="list_servers")]
+    ])
+
+
+_ALL_SERVERS_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="🔄 Обновить", callback_data="chart_all"),
+        InlineKeyboardButton(text="◀️ Назад", callback_data="list_servers")
+    ]
+])
+
+_DASHBOARD_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="🔄 Обновить", callback_data="refresh_dashboard"),
+        InlineKeyboardButton(text="📊 Графики", callback_data="chart_all")
+    ]
+])
+
+_BACK_TO_LIST_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="◀️ Назад", callback_data="list_servers")]
+])
+
+
+@lru_cache(maxsize=1024)
+def _chart_row(server_id: int, last_status: bool, name: str) -> List[InlineKeyboardButton]:
+    """Строка выбора сервера для графика (ключ кэша - всё отображаемое)"""
+    return [InlineKeyboardButton(
+        text=f"{_STATUS_EMOJI[last_status]} {name}",
+        callback_data=f"chart_24h_{server_id}"
+    )]
+
+
 @router.message(Command("chart", "graph"))
 async def cmd_chart(message: Message):
     """Показать график выбранного сервера"""
@@ -874,12 +1212,9 @@ async def cmd_chart(message: Message):
         await message.answer("📭 Нет серверов для отображения.", reply_markup=get_main_keyboard())
         return
     
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(
-            text=f"{get_status_emoji(s.last_status)} {s.name}",
-            callback_data=f"chart_24h_{s.id}"
-        )] for s in servers
-    ] + [[InlineKeyboardButton(text="📊 Все серверы", callback_data="chart_all")]])
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[_chart_row(s.id, s.last_status, s.name) for s in servers] + [_CHART_ALL_ROW]
+    )
     
     await message.answer(
         "📈 <b>Выберите сервер для графика:</b>",
@@ -899,48 +1234,40 @@ async def cmd_dashboard(message: Message):
     
     msg = await message.answer("⏳ Генерирую дашборд...")
     
-    image_bytes = await generate_realtime_status_image(servers)
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="🔄 Обновить", callback_data="refresh_dashboard"),
-            InlineKeyboardButton(text="📊 Графики", callback_data="chart_all")
-        ]
-    ])
-    
-    photo = BufferedInputFile(image_bytes, filename="dashboard.png")
+    path = await get_dashboard_image(servers)
     
     try:
         await msg.delete()
     except Exception:
         pass
     
-    await message.answer_photo(
-        photo=photo,
+    sent = await message.answer_photo(
+        photo=_cached_photo(path, FSInputFile(path, filename=f"dashboard.{STATUS_IMAGE_EXT}")),
         caption="🖥 <b>Текущий статус серверов</b>",
         parse_mode=ParseMode.HTML,
-        reply_markup=keyboard
+        reply_markup=_DASHBOARD_KB
     )
+    _remember_photo(path, sent)
 
 
 @router.callback_query(F.data.startswith("chart_24h_"))
 async def callback_chart_24h(callback: CallbackQuery):
     """График за 24 часа"""
-    server_id = int(callback.data.split("_")[2])
+    server_id = int(callback.data.rpartition("_")[2])
     await _send_chart(callback, server_id, 24)
 
 
 @router.callback_query(F.data.startswith("chart_6h_"))
 async def callback_chart_6h(callback: CallbackQuery):
     """График за 6 часов"""
-    server_id = int(callback.data.split("_")[2])
+    server_id = int(callback.data.rpartition("_")[2])
     await _send_chart(callback, server_id, 6)
 
 
 @router.callback_query(F.data.startswith("chart_12h_"))
 async def callback_chart_12h(callback: CallbackQuery):
     """График за 12 часов"""
-    server_id = int(callback.data.split("_")[2])
+    server_id = int(callback.data.rpartition("_")[2])
     await _send_chart(callback, server_id, 12)
 
 
@@ -953,56 +1280,29 @@ async def _send_chart(callback: CallbackQuery, server_id: int, hours: int):
         await callback.answer("Сервер не найден", show_alert=True)
         return
     
-    try:
-        await callback.message.delete()
-    except Exception:
-        pass
-    
-    loading_msg = await callback.message.answer("⏳ Генерирую график...")
-    
     image_bytes = await generate_uptime_chart(server_id, hours=hours)
     
     if image_bytes:
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="6ч", callback_data=f"chart_6h_{server_id}"),
-                InlineKeyboardButton(text="12ч", callback_data=f"chart_12h_{server_id}"),
-                InlineKeyboardButton(text="24ч", callback_data=f"chart_24h_{server_id}"),
-            ],
-            [
-                InlineKeyboardButton(text="📅 Неделя", callback_data=f"chart_week_{server_id}"),
-                InlineKeyboardButton(text="🔄 Обновить", callback_data=f"chart_{hours}h_{server_id}"),
-            ],
-            [InlineKeyboardButton(text="◀️ Назад", callback_data="list_servers")]
-        ])
-        
-        photo = BufferedInputFile(image_bytes, filename="chart.png")
-        
-        try:
-            await loading_msg.delete()
-        except Exception:
-            pass
-        
-        await callback.message.answer_photo(
-            photo=photo,
-            caption=f"📈 <b>{server.name}</b>\nГрафик за последние {hours} часов",
-            parse_mode=ParseMode.HTML,
-            reply_markup=keyboard
+        await safe_edit_or_send_photo(
+            callback,
+            BufferedInputFile(image_bytes, filename="chart.png"),
+            f"📈 <b>{server.name}</b>\nГрафик за последние {hours} часов",
+            reply_markup=_chart_kb(server_id, hours),
+            cache_key=_image_key(image_bytes)
         )
     else:
-        await loading_msg.edit_text(
+        await safe_edit_or_send(
+            callback,
             "❌ Недостаточно данных для построения графика.\n"
             "Подождите, пока накопится история проверок.",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="◀️ Назад", callback_data="list_servers")]
-            ])
+            reply_markup=_BACK_TO_LIST_KB
         )
 
 
 @router.callback_query(F.data.startswith("chart_week_"))
 async def callback_chart_week(callback: CallbackQuery):
     """Недельный график"""
-    server_id = int(callback.data.split("_")[2])
+    server_id = int(callback.data.rpartition("_")[2])
     
     await callback.answer("📊 Генерирую недельный график...")
     
@@ -1011,43 +1311,21 @@ async def callback_chart_week(callback: CallbackQuery):
         await callback.answer("Сервер не найден", show_alert=True)
         return
     
-    try:
-        await callback.message.delete()
-    except Exception:
-        pass
-    
-    loading_msg = await callback.message.answer("⏳ Генерирую недельный график...")
-    
     image_bytes = await generate_weekly_chart(server_id)
     
     if image_bytes:
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="📊 24 часа", callback_data=f"chart_24h_{server_id}"),
-                InlineKeyboardButton(text="🔄 Обновить", callback_data=f"chart_week_{server_id}"),
-            ],
-            [InlineKeyboardButton(text="◀️ Назад", callback_data="list_servers")]
-        ])
-        
-        photo = BufferedInputFile(image_bytes, filename="weekly_chart.png")
-        
-        try:
-            await loading_msg.delete()
-        except Exception:
-            pass
-        
-        await callback.message.answer_photo(
-            photo=photo,
-            caption=f"📅 <b>{server.name}</b>\nСтатистика за неделю",
-            parse_mode=ParseMode.HTML,
-            reply_markup=keyboard
+        await safe_edit_or_send_photo(
+            callback,
+            BufferedInputFile(image_bytes, filename="weekly_chart.png"),
+            f"📅 <b>{server.name}</b>\nСтатистика за неделю",
+            reply_markup=_weekly_kb(server_id),
+            cache_key=_image_key(image_bytes)
         )
     else:
-        await loading_msg.edit_text(
+        await safe_edit_or_send(
+            callback,
             "❌ Недостаточно данных для недельного графика.",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="◀️ Назад", callback_data="list_servers")]
-            ])
+            reply_markup=_BACK_TO_LIST_KB
         )
 
 
@@ -1056,42 +1334,21 @@ async def callback_chart_all_servers(callback: CallbackQuery):
     """Сводный график по всем серверам"""
     await callback.answer("📊 Генерирую сводный график...")
     
-    try:
-        await callback.message.delete()
-    except Exception:
-        pass
-    
-    loading_msg = await callback.message.answer("⏳ Генерирую сводный график...")
-    
     image_bytes = await generate_all_servers_chart(hours=24)
     
     if image_bytes:
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="🔄 Обновить", callback_data="chart_all"),
-                InlineKeyboardButton(text="◀️ Назад", callback_data="list_servers")
-            ]
-        ])
-        
-        photo = BufferedInputFile(image_bytes, filename="all_servers.png")
-        
-        try:
-            await loading_msg.delete()
-        except Exception:
-            pass
-        
-        await callback.message.answer_photo(
-            photo=photo,
-            caption="📊 <b>Сводка по всем серверам</b>\nЗа последние 24 часа",
-            parse_mode=ParseMode.HTML,
-            reply_markup=keyboard
+        await safe_edit_or_send_photo(
+            callback,
+            BufferedInputFile(image_bytes, filename="all_servers.png"),
+            "📊 <b>Сводка по всем серверам</b>\nЗа последние 24 часа",
+            reply_markup=_ALL_SERVERS_KB,
+            cache_key=_image_key(image_bytes)
         )
     else:
-        await loading_msg.edit_text(
+        await safe_edit_or_send(
+            callback,
             "❌ Нет данных для графика.",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="◀️ Назад", callback_data="list_servers")]
-            ])
+            reply_markup=_BACK_TO_LIST_KB
         )
 
 
@@ -1106,200 +1363,357 @@ async def callback_refresh_dashboard(callback: CallbackQuery):
     
     await callback.answer("🔄 Обновляю...")
     
-    try:
-        await callback.message.delete()
-    except Exception:
-        pass
-    
-    loading_msg = await callback.message.answer("⏳ Обновляю дашборд...")
-    
-    image_bytes = await generate_realtime_status_image(servers)
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="🔄 Обновить", callback_data="refresh_dashboard"),
-            InlineKeyboardButton(text="📊 Графики", callback_data="chart_all")
-        ]
-    ])
-    
-    photo = BufferedInputFile(image_bytes, filename="dashboard.png")
+    path = await get_dashboard_image(servers)
     
+    await safe_edit_or_send_photo(
+        callback,
+        FSInputFile(path, filename=f"dashboard.{STATUS_IMAGE_EXT}"),
+        f"🖥 <b>Текущий статус серверов</b>\n<i>Обновлено: {datetime.now().strftime('%H:%M:%S')}</i>",
+        reply_markup=_DASHBOARD_KB,
+        cache_key=path
+    )
+
+
+# ============= Мониторинг =============
+
+async def check_server_timed(server: Server) -> CheckResult:
+    """Проверка сервера с ограничением по времени"""
     try:
-        await loading_msg.delete()
-    except Exception:
+        return await asyncio.wait_for(
+            check_server(server.host, server.port, server.protocol, PROBE_TIMEOUT),
+            timeout=config.CHECK_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        return CheckResult(
+            is_available=False,
+            method=server.protocol,
+            response_time=None,
+            error="timeout"
+        )
+
+
+async def wait_monitoring_stop(timeout: float):
+    """Пауза между раундами, прерываемая остановкой мониторинга"""
+    try:
+        await asyncio.wait_for(monitoring_stop.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
         pass
+
+
+async def wait_next_check(timeout: float):
+    """Пауза до ближайшей проверки, прерываемая остановкой или пробуждением"""
+    waiters = [
+        asyncio.create_task(monitoring_stop.wait()),
+        asyncio.create_task(monitoring_wake.wait())
+    ]
+    try:
+        await asyncio.wait(waiters, timeout=max(0.0, timeout), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+    monitoring_wake.clear()
+
+
+def check_interval(server: Server, ok_streak: int) -> float:
+    """
+    Интервал до следующей проверки сервера.
+    Сбойные серверы проверяются часто, стабильные - всё реже
+    (вдвое после каждых BACKOFF_STREAK успешных проверок подряд, до MAX_CHECK_INTERVAL).
+    """
+    if server.consecutive_failures > 0 or server.notification_sent:
+        return config.FAST_CHECK_INTERVAL
     
-    await callback.message.answer_photo(
-        photo=photo,
-        caption=f"🖥 <b>Текущий статус серверов</b>\n<i>Обновлено: {datetime.now().strftime('%H:%M:%S')}</i>",
-        parse_mode=ParseMode.HTML,
-        reply_markup=keyboard
-    )
+    interval = config.CHECK_INTERVAL * 2 ** (ok_streak // config.BACKOFF_STREAK)
+    return min(interval, max(config.CHECK_INTERVAL, config.MAX_CHECK_INTERVAL))
 
 
-# ============= Мониторинг =============
+async def probe_server(server: Server) -> CheckResult:
+    """Проверка сервера под общим ограничителем параллелизма"""
+    async with check_limiter:
+        result = await check_server_timed(server)
+        check_limiter.record(result)
+    return result
+
+
+async def _handle_result(server: Server, updated_server: Server, result: CheckResult):
+    """Логирование результата и уведомления о падении/восстановлении"""
+    if result.is_available:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("✅ %s (%s:%s) - OK", server.name, server.host, server.port)
+        
+        if updated_server.notification_sent:
+            confirmed = await confirm_server_recovery(server, 2)
+            
+            if confirmed:
+                await send_recovery_notification(updated_server, result)
+                await db.set_notification_sent(server.id, False)
+                logger.info("✅ %s - RECOVERY CONFIRMED!", server.name)
+    else:
+        logger.warning(
+            "❌ %s (%s:%s) - FAIL (%s/%s)",
+            server.name, server.host, server.port,
+            updated_server.consecutive_failures, config.FAIL_THRESHOLD
+        )
+        
+        if (updated_server.consecutive_failures >= config.FAIL_THRESHOLD 
+            and not updated_server.notification_sent):
+            
+            confirmed_down = await confirm_server_down(server, 2)
+            
+            if confirmed_down:
+                await send_down_notification(updated_server, result)
+                await db.set_notification_sent(server.id, True)
+
 
 async def monitoring_loop():
-    """Основной цикл мониторинга с адаптивным интервалом"""
-    global monitoring_active
-    
+    """Основной цикл мониторинга: у каждого сервера своё время следующей проверки"""
     logger.info("Monitoring loop started")
     
-    NORMAL_INTERVAL = config.CHECK_INTERVAL
-    FAST_INTERVAL = 15
-    CONFIRM_CHECKS = 2
+    # Куча (время следующей проверки, id сервера)
+    schedule: List[Tuple[float, int]] = []
+    scheduled: set = set()
+    ok_streaks: Dict[int, int] = {}
+    # Старая история чистится при запуске и далее раз в сутки
+    next_purge = 0.0
     
-    while monitoring_active:
+    while monitoring_event.is_set():
         try:
-            servers = await db.get_active_servers()
+            active = {s.id: s for s in await db.get_active_servers()}
+            now = time.monotonic()
             
-            has_down_servers = any(
-                s.consecutive_failures >= config.FAIL_THRESHOLD 
-                for s in servers
-            )
+            # Новые и включённые серверы проверяются сразу
+            for server_id in active.keys() - scheduled:
+                heapq.heappush(schedule, (now, server_id))
+                scheduled.add(server_id)
+            
+            # Забираем всё, что подошло, с запасом в секунду, чтобы проверять пачкой
+            servers = []
+            while schedule and schedule[0][0] <= now + 1.0:
+                _, server_id = heapq.heappop(schedule)
+                scheduled.discard(server_id)
+                if server_id in active:
+                    servers.append(active[server_id])
             
-            for server in servers:
-                if not monitoring_active:
-                    break
+            if servers:
+                # Все серверы проверяются параллельно, параллелизм ограничивает check_limiter
+                results = await asyncio.gather(*(probe_server(s) for s in servers))
                 
-                result = await check_server(server.host, server.port, server.protocol)
+                # Результаты пишутся одной транзакцией, она же возвращает новые счётчики
+                updated = {
+                    s.id: s
+                    for s in await db.update_server_status_many([
+                        (server.id, result.is_available, result.response_time, result.error)
+                        for server, result in zip(servers, results)
+                    ])
+                }
                 
-                await db.update_server_status(
-                    server.id,
-                    result.is_available,
-                    result.response_time,
-                    result.error
+                handled = await asyncio.gather(
+                    *(
+                        _handle_result(server, updated[server.id], result)
+                        for server, result in zip(servers, results)
+                        if server.id in updated
+                    ),
+                    return_exceptions=True
                 )
+                for error in handled:
+                    if isinstance(error, BaseException):
+                        logger.error("Error handling check result: %s", error)
                 
-                updated_server = await db.get_server(server.id)
+                # Одна строка на раунд вместо строки на каждый сервер
+                if logger.isEnabledFor(logging.INFO):
+                    failing = [srv.name for srv, res in zip(servers, results) if not res.is_available]
+                    logger.info(
+                        "Round: ok=%d fail=%d failing=%s",
+                        len(servers) - len(failing), len(failing), failing
+                    )
                 
-                if result.is_available:
-                    logger.info(f"✅ {server.name} ({server.host}:{server.port}) - OK")
-                    
-                    if updated_server.notification_sent:
-                        confirmed = await confirm_server_recovery(server, CONFIRM_CHECKS)
-                        
-                        if confirmed:
-                            await send_recovery_notification(updated_server, result)
-                            await db.set_notification_sent(server.id, False)
-                            logger.info(f"✅ {server.name} - RECOVERY CONFIRMED!")
-                else:
-                    logger.warning(
-                        f"❌ {server.name} ({server.host}:{server.port}) - FAIL "
-                        f"({updated_server.consecutive_failures}/{config.FAIL_THRESHOLD})"
+                now = time.monotonic()
+                for server, result in zip(servers, results):
+                    if server.id not in updated:
+                        continue
+                    ok_streaks[server.id] = ok_streaks.get(server.id, 0) + 1 if result.is_available else 0
+                    heapq.heappush(
+                        schedule,
+                        (now + check_interval(updated[server.id], ok_streaks[server.id]), server.id)
                     )
-                    
-                    if (updated_server.consecutive_failures >= config.FAIL_THRESHOLD 
-                        and not updated_server.notification_sent):
-                        
-                        confirmed_down = await confirm_server_down(server, 2)
-                        
-                        if confirmed_down:
-                            await send_down_notification(updated_server, result)
-                            await db.set_notification_sent(server.id, True)
+                    scheduled.add(server.id)
                 
-                await asyncio.sleep(0.5)
+                # Дашборд рисуется здесь, чтобы кнопка "Обновить" брала готовый PNG из кэша
+                try:
+                    await prerender_dashboard()
+                except Exception as e:
+                    logger.error("Dashboard prerender failed: %s", e)
             
-            if has_down_servers:
-                await asyncio.sleep(FAST_INTERVAL)
-            else:
-                await asyncio.sleep(NORMAL_INTERVAL)
+            if time.monotonic() >= next_purge:
+                next_purge = time.monotonic() + 86400
+                deleted = await db.purge_history(config.HISTORY_RETENTION_DAYS)
+                if deleted:
+                    logger.info("Purged %d history rows older than %d days", deleted, config.HISTORY_RETENTION_DAYS)
+            
+            delay = schedule[0][0] - time.monotonic() if schedule else config.CHECK_INTERVAL
+            await wait_next_check(delay)
                 
         except Exception as e:
-            logger.error(f"Error in monitoring loop: {e}")
-            await asyncio.sleep(5)
+            logger.error("Error in monitoring loop: %s", e)
+            await wait_monitoring_stop(5)
     
     logger.info("Monitoring loop stopped")
 
 
+async def _delayed_check(server: Server, delay: float) -> CheckResult:
+    """Проверка сервера после задержки"""
+    await asyncio.sleep(delay)
+    return await check_server_timed(server)
+
+
 async def confirm_server_recovery(server: Server, checks: int = 2) -> bool:
     """Подтверждение восстановления сервера"""
-    logger.info(f"🔄 Confirming recovery for {server.name}...")
+    logger.info("🔄 Confirming recovery for %s...", server.name)
     
-    for i in range(checks):
-        await asyncio.sleep(3)
-        result = await check_server(server.host, server.port, server.protocol)
-        
-        if not result.is_available:
-            logger.warning(f"❌ {server.name} - confirmation check {i+1} failed")
-            return False
-        
-        logger.info(f"✅ {server.name} - confirmation check {i+1}/{checks} OK")
+    # Проверки идут параллельно, равномерно распределены в пределах 3 сек
+    results = await asyncio.gather(
+        *(_delayed_check(server, 3 * (i + 1) / checks) for i in range(checks))
+    )
     
+    ok = sum(r.is_available for r in results)
+    if ok < checks:
+        logger.warning("❌ %s - confirmation failed (%s/%s OK)", server.name, ok, checks)
+        return False
+    
+    logger.info("✅ %s - confirmation %s/%s OK", server.name, ok, checks)
     return True
 
 
 async def confirm_server_down(server: Server, checks: int = 2) -> bool:
     """Подтверждение падения сервера"""
-    logger.info(f"🔄 Confirming down status for {server.name}...")
+    logger.info("🔄 Confirming down status for %s...", server.name)
     
-    for i in range(checks):
-        await asyncio.sleep(2)
-        result = await check_server(server.host, server.port, server.protocol)
-        
-        if result.is_available:
-            logger.info(f"✅ {server.name} - came back during confirmation")
-            return False
-        
-        logger.warning(f"❌ {server.name} - down confirmation {i+1}/{checks}")
+    results = await asyncio.gather(
+        *(_delayed_check(server, 2 * (i + 1) / checks) for i in range(checks))
+    )
+    
+    if any(r.is_available for r in results):
+        logger.info("✅ %s - came back during confirmation", server.name)
+        return False
     
+    logger.warning("❌ %s - down confirmed (%s/%s)", server.name, checks, checks)
     return True
 
 
 async def send_down_notification(server: Server, result: CheckResult):
     """Уведомление о падении"""
-    text = f"""
-🚨🚨🚨 <b>СЕРВЕР НЕДОСТУПЕН!</b> 🚨🚨🚨
-
-📛 Сервер: <b>{server.name}</b>
-📍 Адрес: <code>{server.host}:{server.port}</code>
-📡 Протокол: {server.protocol.upper()}
-
-❌ Ошибка: {result.error}
-⚠️ Неудачных попыток: {server.consecutive_failures + 1}
-⏰ Время: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-
-<b>Требуется проверка!</b>
-"""
+    text = _DOWN_TMPL.format_map({
+        "name": server.name,
+        "host": server.host,
+        "port": server.port,
+        "protocol": server.protocol.upper(),
+        "error": result.error,
+        "failures": server.consecutive_failures + 1,
+        "time": format_timestamp(int(time.time()))
+    })
     await send_notification_to_all(text)
 
 
 async def send_recovery_notification(server: Server, result: CheckResult):
     """Уведомление о восстановлении"""
-    response_time = f"{result.response_time:.1f}ms" if result.response_time else "N/A"
-    
-    text = f"""
-✅✅✅ <b>СЕРВЕР ВОССТАНОВЛЕН!</b> ✅✅✅
-
-📛 Сервер: <b>{server.name}</b>
-📍 Адрес: <code>{server.host}:{server.port}</code>
-📡 Протокол: {server.protocol.upper()}
+    text = _RECOVERY_TMPL.format_map({
+        "name": server.name,
+        "host": server.host,
+        "port": server.port,
+        "protocol": server.protocol.upper(),
+        "response": f"{result.response_time:.1f}ms" if result.response_time else "N/A",
+        "time": format_timestamp(int(time.time()))
+    })
+    await send_notification_to_all(text)
 
-⏱ Время отклика: {response_time}
-⏰ Время: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
 
-<b>Сервер работает нормально.</b>
-"""
-    await send_notification_to_all(text)
+async def send_notification(chat_id: int, text: str) -> bool:
+    """Отправить уведомление одному подписчику (одна повторная попытка при 429)"""
+    try:
+        await send_message(chat_id, text, parse_mode=ParseMode.HTML)
+        return True
+    except TelegramRetryAfter as e:
+        logger.warning("Rate limited for %s, retrying in %ss", chat_id, e.retry_after)
+        await asyncio.sleep(e.retry_after)
+        try:
+            await send_message(chat_id, text, parse_mode=ParseMode.HTML)
+            return True
+        except Exception as e:
+            logger.error("Dropped notification to %s: %s", chat_id, e)
+    except Exception as e:
+        logger.error("Failed to send notification to %s: %s", chat_id, e)
+    return False
 
 
 async def send_notification_to_all(text: str):
     """Отправить уведомление всем подписчикам"""
     subscribers = await db.get_subscribers()
+    if not subscribers:
+        return
     
-    for chat_id in subscribers:
-        try:
-            await bot.send_message(
-                chat_id=chat_id,
-                text=text,
-                parse_mode=ParseMode.HTML
-            )
-        except Exception as e:
-            logger.error(f"Failed to send notification to {chat_id}: {e}")
+    # Лимитеры в send_message держат общий темп, а чаты не ждут друг друга
+    results = await asyncio.gather(
+        *(send_notification(chat_id, text) for chat_id in subscribers),
+        return_exceptions=True
+    )
+    
+    delivered = sum(r is True for r in results)
+    logger.info("Notification delivered to %s/%s subscribers", delivered, len(subscribers))
 
 
 # ============= Запуск =============
 
+async def on_startup(bot: Bot):
+    """Регистрация webhook при старте диспетчера"""
+    if config.WEBHOOK_URL:
+        await bot.set_webhook(
+            f"{config.WEBHOOK_URL.rstrip('/')}{config.WEBHOOK_PATH}",
+            secret_token=config.WEBHOOK_SECRET
+        )
+        logger.info("Webhook set to %s%s", config.WEBHOOK_URL, config.WEBHOOK_PATH)
+
+
+async def run_webhook():
+    """Приём обновлений через webhook (aiohttp за nginx)"""
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config.WEBHOOK_SECRET
+    ).register(app, path=config.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    
+    if config.WEBHOOK_SOCKET:
+        site = web.UnixSite(runner, config.WEBHOOK_SOCKET)
+    else:
+        site = web.TCPSite(runner, config.WEBAPP_HOST, config.WEBAPP_PORT)
+    
+    await site.start()
+    logger.info("Webhook server listening on %s", site.name)
+    
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def _notify_admin(admin_id: int):
+    """Уведомление админа о запуске бота"""
+    try:
+        await send_message(
+            admin_id,
+            "🤖 <b>VPN Monitor Bot запущен!</b>\n\n"
+            "Используйте /startmon для запуска мониторинга.",
+            parse_mode=ParseMode.HTML,
+            reply_markup=get_main_keyboard()
+        )
+    except Exception as e:
+        logger.error("Failed to notify admin %s: %s", admin_id, e)
+
+
 async def main():
     """Главная функция"""
     logger.info("Starting VPN Monitor Bot...")
@@ -1309,23 +1723,32 @@ async def main():
     
     # Регистрируем роутер
     dp.include_router(router)
+    dp.startup.register(on_startup)
     
-    # Уведомление о запуске админам
-    for admin_id in config.ADMIN_IDS:
-        try:
-            await bot.send_message(
-                chat_id=admin_id,
-                text="🤖 <b>VPN Monitor Bot запущен!</b>\n\n"
-                     "Используйте /startmon для запуска мониторинга.",
-                parse_mode=ParseMode.HTML,
-                reply_markup=get_main_keyboard()
-            )
-        except Exception as e:
-            logger.error(f"Failed to notify admin {admin_id}: {e}")
+    # Уведомление о запуске админам (параллельно)
+    await asyncio.gather(
+        *(_notify_admin(admin_id) for admin_id in config.ADMIN_IDS),
+        return_exceptions=True
+    )
     
     # Запуск
-    await dp.start_polling(bot)
+    try:
+        if config.WEBHOOK_URL:
+            await run_webhook()
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        await db.close()
+        shutdown_charts()
 
 
 if __name__ == "__main__":
+    # uvloop (libuv) быстрее стандартного цикла; на Windows недоступен
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        logger.info("uvloop not installed, using default asyncio loop")
+    
     asyncio.run(main())
\ No newline at end of file
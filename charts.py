@@ -1,87 +1,254 @@
 from __future__ import annotations
 
 import io
+import os
+import time
+import uuid
 import asyncio
-from datetime import datetime, timedelta
-from typing import List, Dict, Tuple, Optional
-from concurrent.futures import ThreadPoolExecutor
+import tempfile
+import multiprocessing
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Tuple, Optional, Union, BinaryIO, Callable, Awaitable
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
+import numpy as np
 import matplotlib
 matplotlib.use('Agg')  # Без GUI
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from matplotlib.patches import Patch
+from PIL import Image, ImageColor, ImageDraw, ImageFont
 
 from database import db, Server
 
+# libjpeg-turbo для снимка статуса; без него сохраняем PNG через matplotlib
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
 
-# Настройка стиля графиков
-plt.style.use('seaborn-v0_8-darkgrid')
-plt.rcParams['figure.facecolor'] = '#1a1a2e'
-plt.rcParams['axes.facecolor'] = '#16213e'
-plt.rcParams['axes.edgecolor'] = '#e94560'
-plt.rcParams['axes.labelcolor'] = '#ffffff'
-plt.rcParams['text.color'] = '#ffffff'
-plt.rcParams['xtick.color'] = '#ffffff'
-plt.rcParams['ytick.color'] = '#ffffff'
-plt.rcParams['grid.color'] = '#0f3460'
-plt.rcParams['font.size'] = 10
 
+def _init_worker():
+    """Настройка стиля графиков (в основном процессе и в каждом воркере один раз)"""
+    plt.style.use('seaborn-v0_8-darkgrid')
+    plt.rcParams['figure.facecolor'] = '#1a1a2e'
+    plt.rcParams['axes.facecolor'] = '#16213e'
+    plt.rcParams['axes.edgecolor'] = '#e94560'
+    plt.rcParams['axes.labelcolor'] = '#ffffff'
+    plt.rcParams['text.color'] = '#ffffff'
+    plt.rcParams['xtick.color'] = '#ffffff'
+    plt.rcParams['ytick.color'] = '#ffffff'
+    plt.rcParams['grid.color'] = '#0f3460'
+    plt.rcParams['font.size'] = 10
 
-# Executor для запуска matplotlib в отдельном потоке
-executor = ThreadPoolExecutor(max_workers=2)
+
+_init_worker()
+
+
+# Отрисовка matplotlib - CPU-bound, поэтому в отдельных процессах (не держит GIL бота),
+# по одному на ядро. Воркеры запускаются лениво, когда у бота уже работают потоки
+# (aiosqlite, резолвер), поэтому не fork: forkserver на Linux, на Windows - spawn
+# по умолчанию. initializer настраивает стиль в каждом воркере
+_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Пул отрисовки создаётся при первом графике: воркеры тоже импортируют charts"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context(_START_METHOD),
+            initializer=_init_worker
+        )
+    return _executor
+
+# Параметры сохранения: Telegram всё равно пережимает фото, поэтому
+# dpi 100 и самое быстрое сжатие PNG (zlib level 1)
+_SAVEFIG_KWARGS = {
+    'format': 'png',
+    'dpi': 100,
+    'bbox_inches': 'tight',
+    'facecolor': '#1a1a2e',
+    'edgecolor': 'none',
+    'pil_kwargs': {'compress_level': 1, 'optimize': False},
+}
+
+# Снимок статуса (дашборд) кодируется в JPEG, если доступен simplejpeg
+STATUS_IMAGE_EXT = "jpg" if simplejpeg else "png"
+STATUS_JPEG_QUALITY = 85
+
+# Раскладка снимка статуса (пиксели)
+STATUS_WIDTH = 1000
+STATUS_MIN_HEIGHT = 400
+STATUS_TITLE_HEIGHT = 60
+STATUS_HEADER_HEIGHT = 36
+STATUS_ROW_HEIGHT = 60
+STATUS_FOOTER_HEIGHT = 40
+STATUS_BACKGROUND = '#1a1a2e'
+
+# Фигуры переиспользуются между вызовами внутри процесса-воркера:
+# (вид графика, размер) -> (Figure, оси). Создание фигуры и применение
+# стиля дороже самой отрисовки
+FIGURE_CACHE_SIZE = 8
+_figures: OrderedDict[tuple, tuple] = OrderedDict()
+_DEFAULT_SUBPLOT_PARAMS = {
+    name: plt.rcParams[f'figure.subplot.{name}']
+    for name in ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')
+}
+
+
+def _reuse_figure(key: tuple, nrows: int = 1, ncols: int = 1, **kwargs) -> tuple:
+    """Фигура для графика вида key: из кэша воркера (очищенная) или новая"""
+    cached = _figures.get(key)
+    if cached is None:
+        fig, axes = plt.subplots(nrows, ncols, **kwargs)
+        # Заголовок создаётся один раз: fig.suptitle() затем меняет его текст
+        _figures[key] = (fig, axes, fig.suptitle(''))
+        while len(_figures) > FIGURE_CACHE_SIZE:
+            old_fig, _, _ = _figures.popitem(last=False)[1]
+            plt.close(old_fig)
+        return fig, axes
+    
+    _figures.move_to_end(key)
+    fig, axes, title = cached
+    for ax in np.atleast_1d(axes):
+        ax.clear()
+    # Подписи и легенды уровня фигуры рисуются заново при каждом вызове
+    for text in list(fig.texts):
+        if text is not title:
+            text.remove()
+    title.set_text('')
+    fig.legends.clear()
+    # tight_layout должен стартовать с тех же отступов, что и у новой фигуры
+    fig.subplots_adjust(**_DEFAULT_SUBPLOT_PARAMS)
+    return fig, axes
+
+
+# Каталог для файлов дашборда: tmpfs, если доступен
+TMP_IMAGE_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# Кэш дашборда: отпечаток набора серверов -> (путь к PNG, время рендера).
+# Мониторинг перерисовывает дашборд после каждого раунда, а новые данные
+# меняют отпечаток, поэтому TTL лишь ограничивает возраст метки времени
+DASHBOARD_TTL = 90.0
+DASHBOARD_CACHE_SIZE = 4
+_dashboard_cache: OrderedDict[tuple, Tuple[str, float]] = OrderedDict()
+
+# Вытесненный из кэша файл ещё может читать FSInputFile при отправке,
+# поэтому он удаляется с задержкой дольше таймаута запроса к Telegram
+DASHBOARD_UNLINK_DELAY = 120.0
+_retired_dashboards: Dict[str, asyncio.TimerHandle] = {}
+
+# Число точек на графике доступности: больше глаз всё равно не различит
+CHART_BUCKETS = 200
+
+# Кэш графиков: (вид, параметры, версия данных) -> (PNG, время рендера)
+CHART_TTL = 60.0
+CHART_CACHE_SIZE = 256
+_chart_cache: OrderedDict[tuple, Tuple[bytes, float]] = OrderedDict()
+# Отрисовки в процессе: параллельные запросы того же графика ждут их, а не рисуют заново
+_chart_pending: Dict[tuple, asyncio.Future] = {}
+
+
+def _chart_cache_get(key: tuple) -> Optional[bytes]:
+    """Достать PNG из кэша, если он не устарел"""
+    cached = _chart_cache.get(key)
+    if cached is None:
+        return None
+    
+    image, rendered_at = cached
+    if time.monotonic() - rendered_at >= CHART_TTL:
+        del _chart_cache[key]
+        return None
+    
+    _chart_cache.move_to_end(key)
+    return image
+
+
+def _chart_cache_put(key: tuple, image: Optional[bytes]):
+    """Положить PNG в кэш, вытесняя самые старые записи"""
+    if image is None:
+        return
+    
+    _chart_cache[key] = (image, time.monotonic())
+    _chart_cache.move_to_end(key)
+    while len(_chart_cache) > CHART_CACHE_SIZE:
+        _chart_cache.popitem(last=False)
+
+
+async def _render_once(
+    key: tuple,
+    render: Callable[..., Awaitable[Optional[bytes]]],
+    *args
+) -> Optional[bytes]:
+    """PNG из кэша или единственная отрисовка на ключ, общая для всех ждущих"""
+    cached = _chart_cache_get(key)
+    if cached is not None:
+        return cached
+    
+    pending = _chart_pending.get(key)
+    if pending is None:
+        pending = asyncio.ensure_future(render(*args))
+        _chart_pending[key] = pending
+        
+        def _done(task: asyncio.Future):
+            _chart_pending.pop(key, None)
+            if not task.cancelled() and task.exception() is None:
+                _chart_cache_put(key, task.result())
+        
+        pending.add_done_callback(_done)
+    
+    # shield: отмена одного запроса не прерывает отрисовку для остальных
+    return await asyncio.shield(pending)
 
 
 async def generate_uptime_chart(server_id: int, hours: int = 24) -> Optional[bytes]:
     """Генерация графика доступности сервера"""
     
+    # Пока не появилось новых проверок, отдаём уже отрисованный PNG
+    key = ('uptime', server_id, hours, await db.get_history_version(server_id))
+    return await _render_once(key, _render_uptime_chart, server_id, hours)
+
+
+async def _render_uptime_chart(server_id: int, hours: int) -> Optional[bytes]:
+    """Выборка данных и отрисовка графика доступности"""
     server = await db.get_server(server_id)
     if not server:
         return None
     
-    history = await db.get_server_history(server_id, limit=1000)
+    # SQLite сразу отдаёт ~200 точек вместо сырых строк истории
+    buckets = await db.get_chart_buckets(server_id, hours, n_buckets=CHART_BUCKETS)
     
-    if not history:
+    if not buckets:
         return None
     
-    # Фильтруем по времени
-    cutoff_time = datetime.now() - timedelta(hours=hours)
-    
-    # Парсим данные
-    times = []
-    statuses = []
-    response_times = []
-    
-    for record in reversed(history):
-        try:
-            if isinstance(record['checked_at'], str):
-                check_time = datetime.fromisoformat(record['checked_at'].replace('Z', '+00:00'))
-            else:
-                check_time = record['checked_at']
-            
-            if check_time.tzinfo:
-                check_time = check_time.replace(tzinfo=None)
-            
-            if check_time >= cutoff_time:
-                times.append(check_time)
-                statuses.append(1 if record['is_available'] else 0)
-                response_times.append(record['response_time'] if record['response_time'] else 0)
-        except Exception:
-            continue
-    
-    if not times:
-        return None
+    # Колонки: начало корзины, проверок, успешных, средний отклик (NULL -> nan)
+    data = np.array(buckets, dtype=np.float64)
+    starts, checks, successes, avg = data.T
     
-    # Генерируем график в отдельном потоке
-    loop = asyncio.get_event_loop()
+    times = np.array([datetime.fromtimestamp(t) for t in starts.tolist()], dtype='datetime64[s]')
+    # Корзина с хотя бы одним сбоем считается недоступной
+    statuses = (successes == checks).astype(np.uint8)
+    response_times = np.nan_to_num(avg, nan=0.0)
+    total_checks = int(checks.sum())
+    failures = total_checks - int(successes.sum())
+    
+    # Генерируем график в отдельном процессе
+    loop = asyncio.get_running_loop()
     image_bytes = await loop.run_in_executor(
-        executor,
+        _get_executor(),
         _create_uptime_chart,
         server.name,
         times,
         statuses,
         response_times,
-        hours
+        hours,
+        total_checks,
+        failures
     )
     
     return image_bytes
@@ -89,20 +256,35 @@ async def generate_uptime_chart(server_id: int, hours: int = 24) -> Optional[byt
 
 def _create_uptime_chart(
     server_name: str,
-    times: List[datetime],
-    statuses: List[int],
-    response_times: List[float],
-    hours: int
+    times: np.ndarray,
+    statuses: np.ndarray,
+    response_times: np.ndarray,
+    hours: int,
+    total_checks: int,
+    failures: int
 ) -> bytes:
     """Создание графика (синхронная функция)"""
     
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8), height_ratios=[1, 2])
+    fig, (ax1, ax2) = _reuse_figure(('uptime',), 2, 1, figsize=(12, 8), height_ratios=[1, 2])
     fig.suptitle(f'📊 Мониторинг: {server_name}\nПоследние {hours} часов', 
                  fontsize=14, fontweight='bold', color='#ffffff')
     
+    # Окно графика задаётся явно: по одной точке matplotlib растянул бы ось
+    # на годы, и HourLocator строил бы десятки тысяч делений
+    window_end = datetime.now()
+    window_start = window_end - timedelta(hours=hours)
+    
     # === График 1: Статус (доступен/недоступен) ===
-    colors = ['#00ff88' if s == 1 else '#ff4757' for s in statuses]
-    ax1.bar(times, [1] * len(times), color=colors, width=0.01, alpha=0.8)
+    # Корзины рисуются одной коллекцией шириной в корзину, а не отдельным Rectangle на каждую
+    colors = np.where(statuses == 1, '#00ff88', '#ff4757')
+    bucket_days = max(1, hours * 3600 // CHART_BUCKETS) / 86400
+    ax1.broken_barh(
+        [(x, bucket_days) for x in mdates.date2num(times)],
+        (0, 1),
+        facecolors=colors,
+        alpha=0.8
+    )
+    ax1.xaxis_date()
     ax1.set_ylabel('Статус')
     ax1.set_ylim(0, 1.2)
     ax1.set_yticks([])
@@ -117,18 +299,15 @@ def _create_uptime_chart(
                facecolor='#1a1a2e', edgecolor='#e94560')
     
     # === График 2: Время отклика ===
-    valid_times = []
-    valid_responses = []
-    for t, r in zip(times, response_times):
-        if r > 0:
-            valid_times.append(t)
-            valid_responses.append(r)
-    
-    if valid_responses:
+    valid = response_times > 0
+    
+    if valid.any():
+        valid_times = times[valid]
+        valid_responses = response_times[valid]
         ax2.fill_between(valid_times, valid_responses, alpha=0.3, color='#00d9ff')
         ax2.plot(valid_times, valid_responses, color='#00d9ff', linewidth=1.5, marker='o', markersize=2)
         
-        avg_response = sum(valid_responses) / len(valid_responses)
+        avg_response = float(valid_responses.mean())
         ax2.axhline(y=avg_response, color='#ffa502', linestyle='--', 
                     label=f'Среднее: {avg_response:.1f}ms', alpha=0.8)
         ax2.legend(loc='upper right', facecolor='#1a1a2e', edgecolor='#e94560')
@@ -139,14 +318,13 @@ def _create_uptime_chart(
     
     # Форматирование оси X
     for ax in [ax1, ax2]:
+        ax.set_xlim(window_start, window_end)
         ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
         ax.xaxis.set_major_locator(mdates.HourLocator(interval=max(1, hours // 12)))
         plt.setp(ax.xaxis.get_majorticklabels(), rotation=45, ha='right')
     
     # Статистика
-    uptime_percent = (sum(statuses) / len(statuses)) * 100 if statuses else 0
-    total_checks = len(statuses)
-    failures = statuses.count(0)
+    uptime_percent = (total_checks - failures) / total_checks * 100 if total_checks else 0
     
     stats_text = (
         f"📈 Uptime: {uptime_percent:.1f}%  |  "
@@ -156,14 +334,11 @@ def _create_uptime_chart(
     fig.text(0.5, 0.02, stats_text, ha='center', fontsize=10, 
              color='#ffffff', style='italic')
     
-    plt.tight_layout(rect=[0, 0.05, 1, 0.95])
+    fig.tight_layout(rect=[0, 0.05, 1, 0.95])
     
     # Сохраняем в bytes
     buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight',
-                facecolor='#1a1a2e', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
+    fig.savefig(buf, **_SAVEFIG_KWARGS)
     
     return buf.getvalue()
 
@@ -176,36 +351,22 @@ async def generate_all_servers_chart(hours: int = 24) -> Optional[bytes]:
     if not servers:
         return None
     
+    key = (
+        'all', hours, await db.get_history_version(),
+        tuple((s.id, s.is_active, s.last_status) for s in servers)
+    )
+    return await _render_once(key, _render_all_servers_chart, servers, hours)
+
+
+async def _render_all_servers_chart(servers: List[Server], hours: int) -> bytes:
+    """Выборка статистики и отрисовка сводного графика"""
+    # Один GROUP BY по всем серверам вместо запроса истории на каждый
+    recent_stats = await db.get_all_servers_recent_stats(int(time.time()) - hours * 3600)
     server_data = []
     
     for server in servers:
-        history = await db.get_server_history(server.id, limit=500)
-        
-        if history:
-            cutoff = datetime.now() - timedelta(hours=hours)
-            recent = []
-            
-            for h in history:
-                try:
-                    if isinstance(h['checked_at'], str):
-                        check_time = datetime.fromisoformat(h['checked_at'].replace('Z', '+00:00'))
-                    else:
-                        check_time = h['checked_at']
-                    
-                    if check_time.tzinfo:
-                        check_time = check_time.replace(tzinfo=None)
-                    
-                    if check_time >= cutoff:
-                        recent.append(h)
-                except Exception:
-                    continue
-            
-            if recent:
-                uptime = sum(1 for h in recent if h['is_available']) / len(recent) * 100
-                avg_response = sum(h['response_time'] or 0 for h in recent if h['is_available']) / max(1, sum(1 for h in recent if h['is_available']))
-            else:
-                uptime = 100 if server.last_status else 0
-                avg_response = 0
+        if server.id in recent_stats:
+            uptime, avg_response = recent_stats[server.id]
         else:
             uptime = 100 if server.last_status else 0
             avg_response = 0
@@ -218,9 +379,9 @@ async def generate_all_servers_chart(hours: int = 24) -> Optional[bytes]:
             'last_status': server.last_status
         })
     
-    loop = asyncio.get_event_loop()
+    loop = asyncio.get_running_loop()
     image_bytes = await loop.run_in_executor(
-        executor,
+        _get_executor(),
         _create_all_servers_chart,
         server_data,
         hours
@@ -229,19 +390,24 @@ async def generate_all_servers_chart(hours: int = 24) -> Optional[bytes]:
     return image_bytes
 
 
+def _uptime_colors(uptimes: np.ndarray) -> np.ndarray:
+    """Цвет столбца по uptime: ≥99% зелёный, ≥95% оранжевый, ниже - красный"""
+    return np.where(uptimes >= 99, '#00ff88', np.where(uptimes >= 95, '#ffa502', '#ff4757'))
+
+
 def _create_all_servers_chart(server_data: List[Dict], hours: int) -> bytes:
     """Создание сводного графика"""
     
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
+    fig, (ax1, ax2) = _reuse_figure(('all',), 1, 2, figsize=(14, 6))
     fig.suptitle(f'📊 Сводка по всем серверам\nПоследние {hours} часов',
                  fontsize=14, fontweight='bold', color='#ffffff')
     
     names = [d['name'][:15] for d in server_data]
-    uptimes = [d['uptime'] for d in server_data]
-    responses = [d['avg_response'] for d in server_data]
+    uptimes = np.array([d['uptime'] for d in server_data], dtype=np.float64)
+    responses = np.array([d['avg_response'] for d in server_data], dtype=np.float64)
     
     # === График 1: Uptime ===
-    colors = ['#00ff88' if u >= 99 else '#ffa502' if u >= 95 else '#ff4757' for u in uptimes]
+    colors = _uptime_colors(uptimes)
     bars1 = ax1.barh(names, uptimes, color=colors, alpha=0.8, edgecolor='white', linewidth=0.5)
     ax1.set_xlabel('Uptime %')
     ax1.set_title('🎯 Доступность', fontsize=11, loc='left', color='#00ff88')
@@ -255,7 +421,7 @@ def _create_all_servers_chart(server_data: List[Dict], hours: int) -> bytes:
                 f'{uptime:.1f}%', va='center', fontsize=9, color='#ffffff')
     
     # === График 2: Время отклика ===
-    colors2 = ['#00d9ff' if r < 100 else '#ffa502' if r < 300 else '#ff4757' for r in responses]
+    colors2 = np.where(responses < 100, '#00d9ff', np.where(responses < 300, '#ffa502', '#ff4757'))
     bars2 = ax2.barh(names, responses, color=colors2, alpha=0.8, edgecolor='white', linewidth=0.5)
     ax2.set_xlabel('Время отклика (ms)')
     ax2.set_title('⏱ Среднее время отклика', fontsize=11, loc='left', color='#00d9ff')
@@ -274,13 +440,10 @@ def _create_all_servers_chart(server_data: List[Dict], hours: int) -> bytes:
     fig.legend(handles=legend_elements, loc='lower center', ncol=3,
                facecolor='#1a1a2e', edgecolor='#e94560', fontsize=9)
     
-    plt.tight_layout(rect=[0, 0.08, 1, 0.92])
+    fig.tight_layout(rect=[0, 0.08, 1, 0.92])
     
     buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight',
-                facecolor='#1a1a2e', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
+    fig.savefig(buf, **_SAVEFIG_KWARGS)
     
     return buf.getvalue()
 
@@ -288,49 +451,30 @@ def _create_all_servers_chart(server_data: List[Dict], hours: int) -> bytes:
 async def generate_weekly_chart(server_id: int) -> Optional[bytes]:
     """График за неделю с разбивкой по дням"""
     
+    key = ('weekly', server_id, await db.get_history_version(server_id))
+    return await _render_once(key, _render_weekly_chart, server_id)
+
+
+async def _render_weekly_chart(server_id: int) -> Optional[bytes]:
+    """Выборка дневной статистики и отрисовка недельного графика"""
     server = await db.get_server(server_id)
     if not server:
         return None
     
-    history = await db.get_server_history(server_id, limit=5000)
+    # Группировка по дням выполняется в SQLite
+    daily_rows = await db.get_daily_stats(server_id, days=7)
     
-    if not history:
+    if not daily_rows:
         return None
     
-    # Группируем по дням
-    cutoff = datetime.now() - timedelta(days=7)
-    daily_stats: Dict[str, Dict] = {}
-    
-    for record in history:
-        try:
-            if isinstance(record['checked_at'], str):
-                check_time = datetime.fromisoformat(record['checked_at'].replace('Z', '+00:00'))
-            else:
-                check_time = record['checked_at']
-            
-            if check_time.tzinfo:
-                check_time = check_time.replace(tzinfo=None)
-            
-            if check_time >= cutoff:
-                day_key = check_time.strftime('%Y-%m-%d')
-                
-                if day_key not in daily_stats:
-                    daily_stats[day_key] = {'checks': 0, 'successes': 0, 'responses': []}
-                
-                daily_stats[day_key]['checks'] += 1
-                if record['is_available']:
-                    daily_stats[day_key]['successes'] += 1
-                    if record['response_time']:
-                        daily_stats[day_key]['responses'].append(record['response_time'])
-        except Exception:
-            continue
-    
-    if not daily_stats:
-        return None
+    daily_stats: Dict[str, Dict] = {
+        day: {'checks': checks, 'successes': successes, 'avg_response': avg_response or 0}
+        for day, checks, successes, avg_response in daily_rows
+    }
     
-    loop = asyncio.get_event_loop()
+    loop = asyncio.get_running_loop()
     image_bytes = await loop.run_in_executor(
-        executor,
+        _get_executor(),
         _create_weekly_chart,
         server.name,
         daily_stats
@@ -342,12 +486,13 @@ async def generate_weekly_chart(server_id: int) -> Optional[bytes]:
 def _create_weekly_chart(server_name: str, daily_stats: Dict[str, Dict]) -> bytes:
     """Создание недельного графика"""
     
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8))
+    fig, (ax1, ax2) = _reuse_figure(('weekly',), 2, 1, figsize=(12, 8))
     fig.suptitle(f'📅 Недельная статистика: {server_name}',
                  fontsize=14, fontweight='bold', color='#ffffff')
     
     days = sorted(daily_stats.keys())
-    day_labels = [datetime.strptime(d, '%Y-%m-%d').strftime('%a\n%d.%m') for d in days]
+    # Ключи - 'YYYY-MM-DD' из SQLite: fromisoformat разбирает их без strptime
+    day_labels = [date.fromisoformat(d).strftime('%a\n%d.%m') for d in days]
     
     uptimes = []
     avg_responses = []
@@ -355,12 +500,11 @@ def _create_weekly_chart(server_name: str, daily_stats: Dict[str, Dict]) -> byte
     for day in days:
         stats = daily_stats[day]
         uptime = (stats['successes'] / stats['checks'] * 100) if stats['checks'] > 0 else 0
-        avg_resp = sum(stats['responses']) / len(stats['responses']) if stats['responses'] else 0
         uptimes.append(uptime)
-        avg_responses.append(avg_resp)
+        avg_responses.append(stats['avg_response'])
     
     # === Uptime по дням ===
-    colors = ['#00ff88' if u >= 99 else '#ffa502' if u >= 95 else '#ff4757' for u in uptimes]
+    colors = _uptime_colors(np.array(uptimes, dtype=np.float64))
     bars = ax1.bar(day_labels, uptimes, color=colors, alpha=0.8, edgecolor='white')
     ax1.set_ylabel('Uptime %')
     ax1.set_ylim(0, 105)
@@ -383,22 +527,16 @@ def _create_weekly_chart(server_name: str, daily_stats: Dict[str, Dict]) -> byte
     fig.text(0.5, 0.02, stats_text, ha='center', fontsize=10,
              color='#ffffff', style='italic')
     
-    plt.tight_layout(rect=[0, 0.05, 1, 0.95])
+    fig.tight_layout(rect=[0, 0.05, 1, 0.95])
     
     buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight',
-                facecolor='#1a1a2e', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
+    fig.savefig(buf, **_SAVEFIG_KWARGS)
     
     return buf.getvalue()
 
 
-async def generate_realtime_status_image(servers: List[Server]) -> bytes:
-    """Генерация изображения текущего статуса всех серверов"""
-    
-    loop = asyncio.get_event_loop()
-    
+def _status_info(servers: List[Server]) -> List[Dict]:
+    """Данные для изображения статуса"""
     server_info = []
     for s in servers:
         server_info.append({
@@ -406,82 +544,187 @@ async def generate_realtime_status_image(servers: List[Server]) -> bytes:
             'host': f"{s.host}:{s.port}",
             'status': s.last_status,
             'active': s.is_active,
-            'uptime': ((s.total_checks - s.total_failures) / s.total_checks * 100) if s.total_checks > 0 else 100
+            'uptime': s.uptime_pct
         })
+    return server_info
+
+
+async def generate_realtime_status_image_to(servers: List[Server], path: str) -> str:
+    """Генерация изображения статуса сразу в файл (без буфера в памяти)"""
     
-    image_bytes = await loop.run_in_executor(
-        executor,
-        _create_status_image,
-        server_info
+    loop = asyncio.get_running_loop()
+    
+    await loop.run_in_executor(
+        _get_executor(),
+        _save_status_image,
+        _status_info(servers),
+        path
     )
     
-    return image_bytes
+    return path
+
+
+def _dashboard_fingerprint(servers: List[Server]) -> tuple:
+    """Отпечаток всего, что отображается на дашборде"""
+    return tuple(
+        (s.id, s.name, s.is_active, s.last_status, s.last_check)
+        for s in servers
+    )
 
 
-def _create_status_image(servers: List[Dict]) -> bytes:
-    """Создание изображения статуса"""
+async def get_dashboard_image(servers: List[Server]) -> str:
+    """
+    Путь к PNG дашборда для текущего набора серверов.
+    Повторные запросы с тем же отпечатком в пределах DASHBOARD_TTL
+    не перерисовывают изображение.
+    """
+    fingerprint = _dashboard_fingerprint(servers)
+    now = time.monotonic()
+    
+    cached = _dashboard_cache.get(fingerprint)
+    if cached and now - cached[1] < DASHBOARD_TTL:
+        _dashboard_cache.move_to_end(fingerprint)
+        return cached[0]
+    
+    path = await generate_realtime_status_image_to(
+        servers,
+        os.path.join(TMP_IMAGE_DIR, f"dash_{uuid.uuid4().hex}.{STATUS_IMAGE_EXT}")
+    )
     
-    fig, ax = plt.subplots(figsize=(10, max(4, len(servers) * 0.8)))
-    ax.set_xlim(0, 10)
-    ax.set_ylim(0, len(servers) + 1)
-    ax.axis('off')
+    old = _dashboard_cache.pop(fingerprint, None)
+    if old:
+        _retire_dashboard(old[0])
+    _dashboard_cache[fingerprint] = (path, now)
     
-    fig.suptitle('🖥 Статус серверов', fontsize=16, fontweight='bold', 
-                 color='#ffffff', y=0.98)
+    while len(_dashboard_cache) > DASHBOARD_CACHE_SIZE:
+        _, (old_path, _) = _dashboard_cache.popitem(last=False)
+        _retire_dashboard(old_path)
     
-    for i, server in enumerate(reversed(servers)):
-        y = i + 0.5
+    return path
+
+
+async def prerender_dashboard() -> Optional[str]:
+    """Фоновая отрисовка дашборда по свежим данным из базы"""
+    servers = await db.get_all_servers()
+    if not servers:
+        return None
+    return await get_dashboard_image(servers)
+
+
+def _retire_dashboard(path: str):
+    """Удалить файл дашборда, когда его отправка наверняка завершилась"""
+    loop = asyncio.get_running_loop()
+    _retired_dashboards[path] = loop.call_later(
+        DASHBOARD_UNLINK_DELAY, _remove_retired_dashboard, path
+    )
+
+
+def _remove_retired_dashboard(path: str):
+    _retired_dashboards.pop(path, None)
+    _remove_file(path)
+
+
+def shutdown_charts():
+    """Остановить процессы отрисовки и удалить файлы дашборда при завершении бота"""
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+    
+    for path, handle in _retired_dashboards.items():
+        handle.cancel()
+        _remove_file(path)
+    _retired_dashboards.clear()
+    
+    for path, _ in _dashboard_cache.values():
+        _remove_file(path)
+    _dashboard_cache.clear()
+
+
+def invalidate_dashboard_cache():
+    """Пометить закэшированные дашборды устаревшими"""
+    for fingerprint, (path, _) in _dashboard_cache.items():
+        _dashboard_cache[fingerprint] = (path, float("-inf"))
+
+
+def _remove_file(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+@lru_cache(maxsize=None)
+def _status_font(name: str, size: int) -> ImageFont.FreeTypeFont:
+    """Шрифт DejaVu из поставки matplotlib (загружается один раз на процесс)"""
+    return ImageFont.truetype(os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf', name), size)
+
+
+def _blend(color: str, alpha: float) -> Tuple[int, int, int]:
+    """Цвет с прозрачностью alpha, смешанный с фоном снимка статуса"""
+    fg = ImageColor.getrgb(color)
+    bg = ImageColor.getrgb(STATUS_BACKGROUND)
+    return tuple(round(f * alpha + b * (1 - alpha)) for f, b in zip(fg, bg))
+
+
+def _save_status_image(servers: List[Dict], fp: Union[str, BinaryIO]):
+    """Отрисовка изображения статуса в файл или буфер"""
+    # Только текст и прямоугольники - рисуем Pillow напрямую, без matplotlib
+    width = STATUS_WIDTH
+    rows_top = STATUS_TITLE_HEIGHT + STATUS_HEADER_HEIGHT
+    height = max(STATUS_MIN_HEIGHT, rows_top + len(servers) * STATUS_ROW_HEIGHT + STATUS_FOOTER_HEIGHT)
+    
+    img = Image.new('RGB', (width, height), STATUS_BACKGROUND)
+    draw = ImageDraw.Draw(img)
+    
+    draw.text((width // 2, STATUS_TITLE_HEIGHT // 2), 'Статус серверов',
+              font=_status_font('DejaVuSans-Bold.ttf', 22), fill='#ffffff', anchor='mm')
+    
+    # Заголовки
+    header_font = _status_font('DejaVuSans-Bold.ttf', 14)
+    header_y = STATUS_TITLE_HEIGHT + STATUS_HEADER_HEIGHT // 2
+    for x, label in ((100, 'Сервер'), (500, 'Адрес'), (800, 'Статус'), (920, 'Uptime')):
+        draw.text((x, header_y), label, font=header_font, fill='#888888', anchor='lm')
+    
+    name_font = _status_font('DejaVuSans-Bold.ttf', 17)
+    host_font = _status_font('DejaVuSansMono.ttf', 14)
+    status_font = _status_font('DejaVuSans-Bold.ttf', 14)
+    uptime_font = _status_font('DejaVuSans.ttf', 14)
+    
+    for i, server in enumerate(servers):
+        y = rows_top + i * STATUS_ROW_HEIGHT + STATUS_ROW_HEIGHT // 2
         
         # Статус
         if not server['active']:
             color = '#666666'
-            status_icon = '⏸'
             status_text = 'PAUSED'
         elif server['status']:
             color = '#00ff88'
-            status_icon = '🟢'
             status_text = 'ONLINE'
         else:
             color = '#ff4757'
-            status_icon = '🔴'
             status_text = 'OFFLINE'
         
-        # Фон строки
-        rect = plt.Rectangle((0.1, y - 0.35), 9.8, 0.7, 
-                             facecolor=color, alpha=0.2, edgecolor=color)
-        ax.add_patch(rect)
+        # Фон строки: цвет статуса с прозрачностью 0.2 поверх фона
+        draw.rectangle((10, y - 21, width - 10, y + 21), fill=_blend(color, 0.2), outline=color)
+        draw.ellipse((24, y - 8, 40, y + 8), fill=color)
         
         # Текст
-        ax.text(0.3, y, status_icon, fontsize=14, va='center')
-        ax.text(1.0, y, server['name'], fontsize=12, va='center', 
-               color='#ffffff', fontweight='bold')
-        ax.text(5.0, y, server['host'], fontsize=10, va='center', 
-               color='#888888', family='monospace')
-        ax.text(8.0, y, status_text, fontsize=10, va='center', 
-               color=color, fontweight='bold')
-        ax.text(9.5, y, f"{server['uptime']:.0f}%", fontsize=10, va='center',
-               color='#ffffff')
-    
-    # Заголовки
-    ax.text(1.0, len(servers) + 0.5, 'Сервер', fontsize=10, 
-           color='#888888', fontweight='bold')
-    ax.text(5.0, len(servers) + 0.5, 'Адрес', fontsize=10, 
-           color='#888888', fontweight='bold')
-    ax.text(8.0, len(servers) + 0.5, 'Статус', fontsize=10, 
-           color='#888888', fontweight='bold')
-    ax.text(9.5, len(servers) + 0.5, 'Uptime', fontsize=10, 
-           color='#888888', fontweight='bold')
+        draw.text((100, y), server['name'], font=name_font, fill='#ffffff', anchor='lm')
+        draw.text((500, y), server['host'], font=host_font, fill='#888888', anchor='lm')
+        draw.text((800, y), status_text, font=status_font, fill=color, anchor='lm')
+        draw.text((920, y), f"{server['uptime']:.0f}%", font=uptime_font, fill='#ffffff', anchor='lm')
     
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    fig.text(0.5, 0.02, f'Обновлено: {timestamp}', ha='center', 
-            fontsize=9, color='#666666')
+    draw.text((width // 2, height - STATUS_FOOTER_HEIGHT // 2), f'Обновлено: {timestamp}',
+              font=_status_font('DejaVuSans.ttf', 12), fill='#666666', anchor='mm')
     
-    plt.tight_layout(rect=[0, 0.05, 1, 0.95])
+    if simplejpeg is None:
+        img.save(fp, format='PNG', compress_level=1)
+        return
     
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=150, bbox_inches='tight',
-                facecolor='#1a1a2e', edgecolor='none')
-    buf.seek(0)
-    plt.close(fig)
+    data = simplejpeg.encode_jpeg(np.asarray(img), quality=STATUS_JPEG_QUALITY, colorspace='RGB')
     
-    return buf.getvalue()
\ No newline at end of file
+    if isinstance(fp, str):
+        with open(fp, 'wb') as f:
+            f.write(data)
+    else:
+        fp.write(data)
\ No newline at end of file
@@ -11,9 +11,36 @@ ADMIN_IDS = [int(x.strip()) for x in os.getenv("ADMIN_IDS", "").split(",") if x.
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", 60))
 FAST_CHECK_INTERVAL = int(os.getenv("FAST_CHECK_INTERVAL", 15))
 
+# Стабильные серверы проверяются реже: интервал удваивается после каждых
+# BACKOFF_STREAK успешных проверок подряд, но не больше MAX_CHECK_INTERVAL
+BACKOFF_STREAK = int(os.getenv("BACKOFF_STREAK", 10))
+MAX_CHECK_INTERVAL = int(os.getenv("MAX_CHECK_INTERVAL", CHECK_INTERVAL))
+
+# Максимум одновременных проверок
+MAX_CONCURRENT_CHECKS = int(os.getenv("MAX_CONCURRENT_CHECKS", 32))
+
+# Таймаут одной проверки (сек)
+CHECK_TIMEOUT = float(os.getenv("CHECK_TIMEOUT", 5.0))
+
 # Thresholds
 FAIL_THRESHOLD = int(os.getenv("FAIL_THRESHOLD", 3))
 RECOVERY_THRESHOLD = int(os.getenv("RECOVERY_THRESHOLD", 2))
 
 # Database
-DB_PATH = os.getenv("DB_PATH", "data/servers.db")
\ No newline at end of file
+DB_PATH = os.getenv("DB_PATH", "data/servers.db")
+
+# В историю пишется каждая HISTORY_SAMPLE_EVERY-я проверка и все смены статуса
+HISTORY_SAMPLE_EVERY = int(os.getenv("HISTORY_SAMPLE_EVERY", 4))
+# Сколько дней хранить историю проверок
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", 30))
+
+# Webhook (если WEBHOOK_URL не задан - используется long polling)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_SOCKET = os.getenv("WEBHOOK_SOCKET", "")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "127.0.0.1")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", 8080))
+
+# Логирование (DEBUG, INFO, WARNING, ERROR)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING").upper()
@@ -1,15 +1,18 @@
 from __future__ import annotations  # ← Добавить эту строку в самое начало!
 
 import aiosqlite
+import asyncio
 import os
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Tuple, Dict, AsyncIterator
 from dataclasses import dataclass
 
 import config
 
 
-@dataclass
+@dataclass(slots=True)
 class Server:
     """Модель сервера"""
     id: int
@@ -25,18 +28,92 @@ class Server:
     notification_sent: bool = False
     total_checks: int = 0
     total_failures: int = 0
+    uptime_pct: float = 100.0
+
+
+# Обновление счётчиков после проверки: ?1 - is_available, ?2 - server_id
+_UPDATE_STATUS_SQL = """
+    UPDATE servers SET
+        last_check = CURRENT_TIMESTAMP,
+        last_status = ?1,
+        consecutive_failures = CASE WHEN ?1 THEN 0 ELSE consecutive_failures + 1 END,
+        total_checks = total_checks + 1,
+        total_failures = total_failures + CASE WHEN ?1 THEN 0 ELSE 1 END
+    WHERE id = ?2
+"""
+
+# История хранится сжато: строка истории - серия из checks проверок с одним статусом.
+# Выполняется после _UPDATE_STATUS_SQL. Проверка без смены статуса относительно
+# последней записи (и не HISTORY_SAMPLE_EVERY-я) лишь увеличивает её счётчик checks:
+# ?1 - server_id, ?2 - is_available
+_BUMP_HISTORY_SQL = f"""
+    UPDATE check_history SET checks = checks + 1
+    WHERE id = (
+        SELECT id FROM check_history
+        WHERE server_id = ?1
+        ORDER BY checked_at DESC, id DESC
+        LIMIT 1
+    )
+      AND is_available = ?2
+      AND (SELECT total_checks FROM servers WHERE id = ?1) % {max(1, config.HISTORY_SAMPLE_EVERY)} != 0
+"""
+
+# Новая строка истории только для существующих серверов (checked_at - unix time):
+# первая проверка, смена статуса и каждая HISTORY_SAMPLE_EVERY-я проверка -
+# ровно те случаи, когда _BUMP_HISTORY_SQL ничего не обновил
+_INSERT_HISTORY_SQL = f"""
+    WITH last AS (
+        SELECT is_available FROM check_history
+        WHERE server_id = ?1
+        ORDER BY checked_at DESC, id DESC
+        LIMIT 1
+    )
+    INSERT INTO check_history (server_id, is_available, response_time, error, checked_at)
+    SELECT ?1, ?2, ?3, ?4, CAST(strftime('%s', 'now') AS INTEGER)
+    FROM servers LEFT JOIN last
+    WHERE servers.id = ?1
+      AND (last.is_available IS NULL
+           OR last.is_available != ?2
+           OR servers.total_checks % {max(1, config.HISTORY_SAMPLE_EVERY)} = 0)
+"""
+
+# Настройки соединения: WAL (чтение не ждёт записи), fsync только на чекпойнтах
+_CONNECTION_PRAGMAS = """
+    PRAGMA journal_mode = WAL;
+    PRAGMA synchronous = NORMAL;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA mmap_size = 268435456;
+"""
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """CURRENT_TIMESTAMP SQLite ('YYYY-MM-DD HH:MM:SS', UTC без зоны) -> datetime"""
+    return datetime.fromisoformat(value) if value else None
 
 
 class Database:
+    # Список подписчиков перечитывается не чаще раза в SUBSCRIBERS_TTL секунд
+    SUBSCRIBERS_TTL = 60.0
+    
     def __init__(self, db_path: str = config.DB_PATH):
         self.db_path = db_path
+        self._subscribers: Optional[List[int]] = None
+        self._subscribers_at = 0.0
+        # Одно соединение на всё время работы бота (открывается в init)
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
         
     async def init(self):
         """Инициализация базы данных"""
         # Создаём директорию если не существует
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        async with aiosqlite.connect(self.db_path) as db:
+        self._conn = await aiosqlite.connect(self.db_path)
+        # Строки как aiosqlite.Row для всех запросов; горячие выборки переключают курсор на кортежи
+        self._conn.row_factory = aiosqlite.Row
+        await self._conn.executescript(_CONNECTION_PRAGMAS)
+        
+        async with self._write() as db:
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS servers (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -56,6 +133,17 @@ class Database:
                 )
             """)
             
+            # Миграция: uptime за всё время считает сама SQLite (генерируемый столбец)
+            async with db.execute("PRAGMA table_xinfo(servers)") as cursor:
+                columns = {row[1] for row in await cursor.fetchall()}
+            if "uptime_pct" not in columns:
+                await db.execute("""
+                    ALTER TABLE servers ADD COLUMN uptime_pct REAL GENERATED ALWAYS AS (
+                        CASE WHEN total_checks = 0 THEN 100.0
+                             ELSE (total_checks - total_failures) * 100.0 / total_checks END
+                    ) VIRTUAL
+                """)
+            
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS check_history (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -63,11 +151,37 @@ class Database:
                     is_available BOOLEAN,
                     response_time REAL,
                     error TEXT,
-                    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    checked_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+                    checks INTEGER NOT NULL DEFAULT 1,
                     FOREIGN KEY (server_id) REFERENCES servers(id) ON DELETE CASCADE
                 )
             """)
             
+            # Миграция: число проверок, которое представляет строка истории
+            async with db.execute("PRAGMA table_info(check_history)") as cursor:
+                columns = {row[1] for row in await cursor.fetchall()}
+            if "checks" not in columns:
+                await db.execute(
+                    "ALTER TABLE check_history ADD COLUMN checks INTEGER NOT NULL DEFAULT 1"
+                )
+            
+            # Миграция: checked_at из строки UTC в unix time
+            await db.execute("""
+                UPDATE check_history
+                SET checked_at = CAST(strftime('%s', checked_at) AS INTEGER)
+                WHERE typeof(checked_at) = 'text'
+            """)
+            
+            # Индексы под выборки истории сервера по времени и общий обзор
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_history_server_time
+                ON check_history(server_id, checked_at DESC)
+            """)
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_history_time
+                ON check_history(checked_at)
+            """)
+            
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS subscribers (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -77,11 +191,40 @@ class Database:
                 )
             """)
             
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_subscribers_active
+                ON subscribers(is_active) WHERE is_active = 1
+            """)
+            
             await db.commit()
     
+    async def close(self):
+        """Закрыть соединение с базой"""
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+    
+    @asynccontextmanager
+    async def _read(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Соединение для чтения (без блокировки)"""
+        yield self._conn
+    
+    @asynccontextmanager
+    async def _write(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Соединение для записи: транзакции выполняются по одной"""
+        async with self._write_lock:
+            # Блокировку записи берём сразу, а не при первом UPDATE
+            await self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            finally:
+                # Не оставляем незавершённую транзакцию на общем соединении
+                if self._conn.in_transaction:
+                    await self._conn.rollback()
+    
     async def add_server(self, name: str, host: str, port: int, protocol: str = "tcp") -> Optional[int]:
         """Добавить сервер"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             try:
                 cursor = await db.execute(
                     "INSERT INTO servers (name, host, port, protocol) VALUES (?, ?, ?, ?)",
@@ -94,15 +237,14 @@ class Database:
     
     async def remove_server(self, server_id: int) -> bool:
         """Удалить сервер"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             cursor = await db.execute("DELETE FROM servers WHERE id = ?", (server_id,))
             await db.commit()
             return cursor.rowcount > 0
     
     async def get_server(self, server_id: int) -> Optional[Server]:
         """Получить сервер по ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute("SELECT * FROM servers WHERE id = ?", (server_id,)) as cursor:
                 row = await cursor.fetchone()
                 if row:
@@ -111,20 +253,32 @@ class Database:
     
     async def get_all_servers(self) -> List[Server]:
         """Получить все серверы"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute("SELECT * FROM servers ORDER BY id") as cursor:
                 rows = await cursor.fetchall()
                 return [self._row_to_server(row) for row in rows]
     
     async def get_active_servers(self) -> List[Server]:
         """Получить активные серверы"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute("SELECT * FROM servers WHERE is_active = 1 ORDER BY id") as cursor:
                 rows = await cursor.fetchall()
                 return [self._row_to_server(row) for row in rows]
     
+    async def _select_servers_by_ids(
+        self,
+        db: aiosqlite.Connection,
+        server_ids: List[int]
+    ) -> List[Server]:
+        """SELECT ... WHERE id IN (...) на уже открытом соединении"""
+        placeholders = ",".join("?" * len(server_ids))
+        async with db.execute(
+            f"SELECT * FROM servers WHERE id IN ({placeholders}) ORDER BY id",
+            server_ids
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [self._row_to_server(row) for row in rows]
+    
     async def update_server_status(
         self,
         server_id: int,
@@ -133,48 +287,76 @@ class Database:
         error: Optional[str] = None
     ):
         """Обновить статус сервера после проверки"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Получаем текущие данные
+        async with self._write() as db:
+            await self._apply_statuses(db, [(server_id, is_available, response_time, error)])
+            await db.commit()
+    
+    async def update_server_status_many(
+        self,
+        rows: List[Tuple[int, bool, Optional[float], Optional[str]]]
+    ) -> List[Server]:
+        """
+        Обновить статусы нескольких серверов одной транзакцией
+        и вернуть обновлённые записи.
+        rows: (server_id, is_available, response_time, error)
+        """
+        if not rows:
+            return []
+        
+        async with self._write() as db:
+            await self._apply_statuses(db, rows)
+            # Перечитываем в той же транзакции, чтобы не открывать второе соединение
+            updated = await self._select_servers_by_ids(db, [row[0] for row in rows])
+            await db.commit()
+            return updated
+    
+    async def _apply_statuses(
+        self,
+        db: aiosqlite.Connection,
+        rows: List[Tuple[int, bool, Optional[float], Optional[str]]]
+    ):
+        """UPDATE счётчиков и INSERT в историю пачкой (executemany) в текущей транзакции"""
+        # Счётчики считаются в самом UPDATE, без предварительного SELECT
+        await db.executemany(
+            _UPDATE_STATUS_SQL,
+            [(is_available, server_id) for server_id, is_available, _, _ in rows]
+        )
+        await db.executemany(
+            _BUMP_HISTORY_SQL,
+            [(server_id, is_available) for server_id, is_available, _, _ in rows]
+        )
+        await db.executemany(_INSERT_HISTORY_SQL, rows)
+    
+    async def update_server_status_returning(
+        self,
+        server_id: int,
+        is_available: bool,
+        response_time: Optional[float] = None,
+        error: Optional[str] = None
+    ) -> Optional[Server]:
+        """Обновить статус сервера и вернуть обновлённую запись"""
+        async with self._write() as db:
             async with db.execute(
-                "SELECT consecutive_failures, notification_sent, total_checks, total_failures FROM servers WHERE id = ?",
-                (server_id,)
+                _UPDATE_STATUS_SQL + " RETURNING *",
+                (is_available, server_id)
             ) as cursor:
                 row = await cursor.fetchone()
-                if not row:
-                    return
-                
-                consecutive_failures, notification_sent, total_checks, total_failures = row
             
-            # Обновляем счётчики
-            if is_available:
-                new_consecutive_failures = 0
-            else:
-                new_consecutive_failures = consecutive_failures + 1
-                total_failures += 1
-            
-            total_checks += 1
-            
-            await db.execute("""
-                UPDATE servers SET
-                    last_check = CURRENT_TIMESTAMP,
-                    last_status = ?,
-                    consecutive_failures = ?,
-                    total_checks = ?,
-                    total_failures = ?
-                WHERE id = ?
-            """, (is_available, new_consecutive_failures, total_checks, total_failures, server_id))
-            
-            # Сохраняем в историю
-            await db.execute("""
-                INSERT INTO check_history (server_id, is_available, response_time, error)
-                VALUES (?, ?, ?, ?)
-            """, (server_id, is_available, response_time, error))
+            if not row:
+                return None
             
+            await db.execute(_BUMP_HISTORY_SQL, (server_id, is_available))
+            await db.execute(
+                _INSERT_HISTORY_SQL,
+                (server_id, is_available, response_time, error)
+            )
             await db.commit()
+            
+            return self._row_to_server(row)
     
     async def set_notification_sent(self, server_id: int, sent: bool):
         """Установить флаг отправки уведомления"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 "UPDATE servers SET notification_sent = ? WHERE id = ?",
                 (sent, server_id)
@@ -183,7 +365,7 @@ class Database:
     
     async def toggle_server(self, server_id: int) -> Optional[bool]:
         """Переключить активность сервера"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             async with db.execute("SELECT is_active FROM servers WHERE id = ?", (server_id,)) as cursor:
                 row = await cursor.fetchone()
                 if not row:
@@ -199,13 +381,14 @@ class Database:
     
     async def add_subscriber(self, chat_id: int) -> bool:
         """Добавить подписчика на уведомления"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             try:
                 await db.execute(
                     "INSERT INTO subscribers (chat_id) VALUES (?)",
                     (chat_id,)
                 )
                 await db.commit()
+                self._subscribers = None
                 return True
             except aiosqlite.IntegrityError:
                 # Уже подписан, активируем
@@ -214,31 +397,39 @@ class Database:
                     (chat_id,)
                 )
                 await db.commit()
+                self._subscribers = None
                 return True
     
     async def remove_subscriber(self, chat_id: int) -> bool:
         """Удалить подписчика"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute(
                 "UPDATE subscribers SET is_active = 0 WHERE chat_id = ?",
                 (chat_id,)
             )
             await db.commit()
+            self._subscribers = None
             return True
     
     async def get_subscribers(self) -> List[int]:
-        """Получить список активных подписчиков"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Получить список активных подписчиков (кэшируется до изменения подписок)"""
+        if (self._subscribers is not None
+                and time.monotonic() - self._subscribers_at < self.SUBSCRIBERS_TTL):
+            return self._subscribers
+        
+        async with self._read() as db:
             async with db.execute(
                 "SELECT chat_id FROM subscribers WHERE is_active = 1"
             ) as cursor:
                 rows = await cursor.fetchall()
-                return [row[0] for row in rows]
+        
+        self._subscribers = [row[0] for row in rows]
+        self._subscribers_at = time.monotonic()
+        return self._subscribers
     
     async def get_server_history(self, server_id: int, limit: int = 100) -> List[dict]:
         """Получить историю проверок сервера"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._read() as db:
             async with db.execute("""
                 SELECT * FROM check_history 
                 WHERE server_id = ? 
@@ -248,9 +439,131 @@ class Database:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
     
+    async def get_recent_checks(
+        self,
+        server_id: int,
+        limit: int = 5
+    ) -> List[Tuple[bool, Optional[float], int, int]]:
+        """
+        Последние записи истории сервера без лишних колонок.
+        Строки: (доступен, время отклика, unix time начала серии, проверок в серии)
+        """
+        async with self._read() as db:
+            async with db.execute("""
+                SELECT is_available, response_time, checked_at, checks
+                FROM check_history
+                WHERE server_id = ?
+                ORDER BY checked_at DESC
+                LIMIT ?
+            """, (server_id, limit)) as cursor:
+                # Кортежи вместо aiosqlite.Row/dict на каждую строку
+                cursor.row_factory = None
+                return await cursor.fetchall()
+    
+    async def purge_history(self, days: int) -> int:
+        """Удалить историю старше days дней, вернуть число удалённых строк"""
+        since = int(time.time()) - days * 86400
+        async with self._write() as db:
+            cursor = await db.execute(
+                "DELETE FROM check_history WHERE checked_at < ?",
+                (since,)
+            )
+            await db.commit()
+            return cursor.rowcount
+    
+    async def get_chart_buckets(
+        self,
+        server_id: int,
+        hours: int,
+        n_buckets: int = 200
+    ) -> List[Tuple[int, int, int, Optional[float]]]:
+        """
+        История за последние hours часов, сгруппированная в n_buckets корзин.
+        Строки: (начало корзины, проверок, успешных, среднее время отклика)
+        """
+        bucket_sec = max(1, hours * 3600 // n_buckets)
+        since = int(time.time()) - hours * 3600
+        async with self._read() as db:
+            async with db.execute("""
+                SELECT ?1 + (checked_at - ?1) / ?2 * ?2 AS bucket_start,
+                       SUM(checks),
+                       SUM(is_available * checks),
+                       AVG(CASE WHEN response_time > 0 THEN response_time END)
+                FROM check_history
+                WHERE server_id = ?3 AND checked_at >= ?1
+                GROUP BY bucket_start
+                ORDER BY bucket_start
+            """, (since, bucket_sec, server_id)) as cursor:
+                cursor.row_factory = None
+                return await cursor.fetchall()
+    
+    async def get_daily_stats(
+        self,
+        server_id: int,
+        days: int = 7
+    ) -> List[Tuple[str, int, int, Optional[float]]]:
+        """
+        Статистика по дням (локальное время) за последние days дней.
+        Строки: ('YYYY-MM-DD', проверок, успешных, среднее время отклика успешных)
+        """
+        since = int(time.time()) - days * 86400
+        async with self._read() as db:
+            async with db.execute("""
+                SELECT date(checked_at, 'unixepoch', 'localtime') AS day,
+                       SUM(checks),
+                       SUM(is_available * checks),
+                       AVG(CASE WHEN is_available AND response_time > 0 THEN response_time END)
+                FROM check_history
+                WHERE server_id = ? AND checked_at >= ?
+                GROUP BY day
+                ORDER BY day
+            """, (server_id, since)) as cursor:
+                cursor.row_factory = None
+                return await cursor.fetchall()
+    
+    async def get_all_servers_recent_stats(self, since: int) -> Dict[int, Tuple[float, float]]:
+        """
+        Uptime (%) и среднее время отклика успешных проверок
+        по каждому серверу начиная с since (unix time), одним запросом
+        """
+        async with self._read() as db:
+            async with db.execute("""
+                SELECT server_id,
+                       SUM(is_available * checks) * 100.0 / SUM(checks),
+                       COALESCE(AVG(CASE WHEN is_available AND response_time > 0 THEN response_time END), 0)
+                FROM check_history
+                WHERE checked_at >= ?
+                GROUP BY server_id
+            """, (since,)) as cursor:
+                return {row[0]: (row[1], row[2]) for row in await cursor.fetchall()}
+    
+    async def get_history_version(self, server_id: Optional[int] = None) -> Optional[tuple]:
+        """
+        Версия истории (сервера или всей базы) для ключей кэша графиков.
+        Проверка без смены статуса лишь увеличивает checks последней строки,
+        не меняя checked_at, поэтому в версию входит и счётчик проверок
+        """
+        async with self._read() as db:
+            if server_id is None:
+                query, params = """
+                    SELECT (SELECT MAX(checked_at) FROM check_history), SUM(total_checks)
+                    FROM servers
+                """, ()
+            else:
+                query = """
+                    SELECT (SELECT MAX(checked_at) FROM check_history WHERE server_id = ?1),
+                           total_checks
+                    FROM servers WHERE id = ?1
+                """
+                params = (server_id,)
+            async with db.execute(query, params) as cursor:
+                cursor.row_factory = None
+                row = await cursor.fetchone()
+                return tuple(row) if row else None
+    
     async def reset_server_stats(self, server_id: int):
         """Сбросить статистику сервера"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
             await db.execute("""
                 UPDATE servers SET
                     total_checks = 0,
@@ -271,13 +584,14 @@ class Database:
             port=row["port"],
             protocol=row["protocol"],
             is_active=bool(row["is_active"]),
-            created_at=row["created_at"],
-            last_check=row["last_check"],
+            created_at=_parse_timestamp(row["created_at"]),
+            last_check=_parse_timestamp(row["last_check"]),
             last_status=bool(row["last_status"]),
             consecutive_failures=row["consecutive_failures"],
             notification_sent=bool(row["notification_sent"]),
             total_checks=row["total_checks"],
-            total_failures=row["total_failures"]
+            total_failures=row["total_failures"],
+            uptime_pct=row["uptime_pct"]
         )
 
 
@@ -1,14 +1,19 @@
 from __future__ import annotations  # ← Добавить эту строку!
 
 import asyncio
+import itertools
+import os
 import socket
 import platform
-from datetime import datetime
+import shutil
+import struct
+import time
+from collections import deque
 from dataclasses import dataclass
-from typing import Optional
+from typing import Deque, Dict, List, Optional, Tuple
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class CheckResult:
     """Результат проверки"""
     is_available: bool
@@ -17,99 +22,576 @@ class CheckResult:
     error: Optional[str]
 
 
+# Типовые отказы: CheckResult неизменяемый, поэтому один экземпляр на все проверки
+_PING_TIMEOUT = CheckResult(False, "ping", None, "Timeout")
+_PING_FAILED = CheckResult(False, "ping", None, "Ping failed")
+_TCP_TIMEOUT = CheckResult(False, "tcp", None, "Connection timeout")
+_TCP_REFUSED = CheckResult(False, "tcp", None, "Connection refused")
+_UDP_TIMEOUT = CheckResult(False, "udp", None, "Timeout")
+
+
+class AIMDLimiter:
+    """
+    Адаптивный лимит одновременных проверок (AIMD).
+    При ошибках или высокой задержке лимит умножается на beta,
+    при нормальной задержке растёт на alpha до c_max.
+    """
+    
+    def __init__(
+        self,
+        c_max: int,
+        c_min: int = 4,
+        alpha: float = 0.5,
+        beta: float = 0.5,
+        target_latency: float = 1000.0,
+        window: int = 20
+    ):
+        self.c_max = max(1, c_max)
+        self.c_min = max(1, min(c_min, self.c_max))
+        self.alpha = alpha
+        self.beta = beta
+        self.target_latency = target_latency
+        self.c = float(self.c_max)
+        
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._since_decrease = window
+        self._active = 0
+        self._cond = asyncio.Condition()
+    
+    @property
+    def limit(self) -> int:
+        return max(self.c_min, int(self.c))
+    
+    async def __aenter__(self) -> AIMDLimiter:
+        async with self._cond:
+            while self._active >= self.limit:
+                await self._cond.wait()
+            self._active += 1
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+    
+    def record(self, result: CheckResult):
+        """Учесть результат проверки и скорректировать лимит"""
+        self._since_decrease += 1
+        
+        if result.response_time is not None:
+            self._latencies.append(result.response_time)
+        
+        avg_latency = sum(self._latencies) / len(self._latencies) if self._latencies else 0.0
+        
+        if result.error or avg_latency > self.target_latency:
+            # Не уменьшаем чаще раза за окно, иначе пачка таймаутов
+            # от одного раунда обрушит лимит до минимума
+            if self._since_decrease >= self._latencies.maxlen:
+                self.c = max(self.c_min, self.c * self.beta)
+                self._since_decrease = 0
+        else:
+            self.c = min(self.c_max, self.c + self.alpha)
+
+
+# Кэш DNS: host -> (адреса, момент устаревания).
+# Один запрос на хост для всех проверок - порт подставляется при выдаче
+DNS_TTL = 300.0
+_dns_cache: Dict[str, Tuple[List[Tuple[int, tuple]], float]] = {}
+
+
+async def resolve(host: str, port: int) -> List[Tuple[int, tuple]]:
+    """getaddrinfo с кэшем на DNS_TTL секунд: [(family, sockaddr), ...]"""
+    now = time.monotonic()
+    
+    cached = _dns_cache.get(host)
+    if cached and cached[1] > now:
+        addrs = cached[0]
+    else:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        addrs = [(family, sockaddr) for family, _, _, _, sockaddr in infos]
+        _dns_cache[host] = (addrs, now + DNS_TTL)
+    
+    # sockaddr IPv6 - (адрес, порт, flowinfo, scope_id), меняем только порт
+    return [(family, (sockaddr[0], port) + sockaddr[2:]) for family, sockaddr in addrs]
+
+
+# На Linux сокет создаётся сразу неблокирующим, без отдельного ioctl на каждую проверку
+_SOCK_NONBLOCK = getattr(socket, "SOCK_NONBLOCK", 0)
+
+
+def _nonblocking_socket(family: int, sock_type: int, proto: int = 0) -> socket.socket:
+    """Неблокирующий сокет для работы через event loop"""
+    sock = socket.socket(family, sock_type | _SOCK_NONBLOCK, proto)
+    if not _SOCK_NONBLOCK:
+        sock.setblocking(False)
+    return sock
+
+
+# ICMP echo: тип, код, контрольная сумма, идентификатор, номер
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+_ICMP_HEADER = struct.Struct("!BBHHH")
+_ICMP_PAYLOAD = bytes(32)
+_icmp_seq = itertools.count(1)
+
+# Платформа определяется один раз при импорте
+_SYSTEM = platform.system()
+_IS_WINDOWS = _SYSTEM == "Windows"
+_IS_LINUX = _SYSTEM == "Linux"
+
+# Аргументы системного ping: один пакет и таймаут ответа
+_PING_COMMAND = ("ping", "-n", "1", "-w") if _IS_WINDOWS else ("ping", "-c", "1", "-W")
+
+# fping (необязательно) пингует список хостов одним процессом
+_FPING = shutil.which("fping")
+
+
+def _icmp_checksum(data: bytes) -> int:
+    """Контрольная сумма ICMP: 16-битная сумма в обратном коде (RFC 1071)"""
+    if len(data) % 2:
+        data += b"\x00"
+    
+    # Весь пакет как одно большое число: 2^16 = 1 (mod 0xFFFF), поэтому сумма
+    # 16-битных слов с переносом по кругу равна остатку от деления на 0xFFFF
+    # (кроме ненулевых данных с остатком 0 - там сумма в обратном коде 0xFFFF)
+    value = int.from_bytes(data, "big")
+    total = value % 0xFFFF or (0xFFFF if value else 0)
+    return ~total & 0xFFFF
+
+
+def _open_icmp_socket() -> Optional[Tuple[socket.socket, bool]]:
+    """Неблокирующий ICMP-сокет: (сокет, raw) или None, если ядро не даёт прав"""
+    # SOCK_DGRAM доступен без root при net.ipv4.ping_group_range,
+    # SOCK_RAW - под root или с CAP_NET_RAW
+    for sock_type in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        try:
+            sock = _nonblocking_socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP)
+        except OSError:
+            continue
+        return sock, sock_type == socket.SOCK_RAW
+    return None
+
+
+async def _icmp_echo(sock: socket.socket, raw: bool, address: str, ident: int, seq: int):
+    """Отправить echo request и дождаться нашего echo reply"""
+    loop = asyncio.get_running_loop()
+    
+    header = _ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = _icmp_checksum(header + _ICMP_PAYLOAD)
+    packet = _ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + _ICMP_PAYLOAD
+    # connect() на ICMP-сокете сетевого обмена не делает, но позволяет обойтись
+    # sock_sendall вместо sock_sendto (его нет в uvloop) и отсекает ответы чужих хостов
+    sock.connect((address, 0))
+    await loop.sock_sendall(sock, packet)
+    
+    while True:
+        data = await loop.sock_recv(sock, 1024)
+        if raw:
+            # Raw-сокет отдаёт пакет вместе с IP-заголовком и видит чужие ответы
+            data = data[(data[0] & 0x0F) * 4:]
+        if len(data) < _ICMP_HEADER.size:
+            continue
+        
+        icmp_type, _, _, reply_ident, reply_seq = _ICMP_HEADER.unpack_from(data)
+        # Для DGRAM-сокета идентификатор подставляет ядро, оно же фильтрует ответы
+        if icmp_type == ICMP_ECHO_REPLY and reply_seq == seq and (not raw or reply_ident == ident):
+            return
+
+
 async def check_ping(host: str, timeout: int = 5) -> CheckResult:
     """Проверка через ICMP ping"""
-    start_time = datetime.now()
-    
-    param = "-n" if platform.system().lower() == "windows" else "-c"
-    timeout_param = "-w" if platform.system().lower() == "windows" else "-W"
+    start_time = time.perf_counter()
+    # Общий бюджет на резолв и echo: медленный DNS не удваивает время проверки
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
     
-    command = ["ping", param, "1", timeout_param, str(timeout), host]
+    try:
+        async with asyncio.timeout_at(deadline):
+            addrs = await resolve(host, 0)
+        address = next((sockaddr[0] for family, sockaddr in addrs if family == socket.AF_INET), None)
+        
+        opened = _open_icmp_socket() if address else None
+        if opened is None:
+            # Нет прав на ICMP-сокет или у хоста только IPv6 - отдаём системному ping
+            # уже известный адрес, чтобы он не резолвил имя заново
+            return await _check_ping_subprocess(addrs[0][1][0], deadline - loop.time())
+        
+        sock, raw = opened
+        try:
+            seq = next(_icmp_seq) & 0xFFFF
+            async with asyncio.timeout_at(deadline):
+                await _icmp_echo(sock, raw, address, os.getpid() & 0xFFFF, seq)
+        finally:
+            sock.close()
+        
+        response_time = (time.perf_counter() - start_time) * 1000
+        return CheckResult(True, "ping", response_time, None)
+        
+    except asyncio.TimeoutError:
+        return _PING_TIMEOUT
+    except Exception as e:
+        return CheckResult(False, "ping", None, str(e))
+
+
+async def _check_ping_subprocess(host: str, timeout: int = 5) -> CheckResult:
+    """Проверка через системный ping, если ICMP-сокет недоступен"""
+    start_time = time.perf_counter()
     
     try:
         process = await asyncio.create_subprocess_exec(
-            *command,
+            *_PING_COMMAND, str(timeout), host,
             stdout=asyncio.subprocess.DEVNULL,
             stderr=asyncio.subprocess.DEVNULL
         )
-        await asyncio.wait_for(process.wait(), timeout=timeout + 2)
+        async with asyncio.timeout(timeout + 2):
+            await process.wait()
         
-        response_time = (datetime.now() - start_time).total_seconds() * 1000
+        response_time = (time.perf_counter() - start_time) * 1000
         
         if process.returncode == 0:
             return CheckResult(True, "ping", response_time, None)
         else:
-            return CheckResult(False, "ping", None, "Ping failed")
+            return _PING_FAILED
             
     except asyncio.TimeoutError:
-        return CheckResult(False, "ping", None, "Timeout")
+        return _PING_TIMEOUT
     except Exception as e:
         return CheckResult(False, "ping", None, str(e))
 
 
+async def check_pings(hosts: List[str], timeout_ms: int = 1000) -> Dict[str, CheckResult]:
+    """Ping списка хостов: {host: результат}"""
+    hosts = list(dict.fromkeys(hosts))
+    
+    opened = _open_icmp_socket()
+    if opened is not None:
+        opened[0].close()
+    
+    # С ICMP-сокетом процессы не нужны вовсе; без fping остаётся системный ping на каждый хост
+    if opened is not None or _FPING is None or not hosts:
+        results = await asyncio.gather(*(check_ping(host, timeout_ms / 1000) for host in hosts))
+        return dict(zip(hosts, results))
+    
+    try:
+        process = await asyncio.create_subprocess_exec(
+            _FPING, "-C", "1", "-q", "-t", str(timeout_ms), *hosts,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            async with asyncio.timeout(timeout_ms / 1000 + 2):
+                _, stderr = await process.communicate()
+        except asyncio.TimeoutError:
+            process.kill()
+            raise
+        
+    except asyncio.TimeoutError:
+        return dict.fromkeys(hosts, _PING_TIMEOUT)
+    except Exception as e:
+        return dict.fromkeys(hosts, CheckResult(False, "ping", None, str(e)))
+    
+    # Строки вида "host : 0.05" или "host : -", если ответа не было
+    results = dict.fromkeys(hosts, _PING_FAILED)
+    for line in stderr.decode(errors="replace").splitlines():
+        host, sep, rtt = line.partition(" : ")
+        host = host.strip()
+        if not sep or host not in results:
+            continue
+        try:
+            results[host] = CheckResult(True, "ping", float(rtt), None)
+        except ValueError:
+            pass
+    return results
+
+
+# Кэш успешных TCP-проверок: (host, port) -> (результат, момент устаревания).
+# Повторная проверка того же порта в пределах PROBE_CACHE_TTL секунд
+# (ручная проверка во время раунда мониторинга) не открывает новое соединение.
+# Записи идут в порядке устаревания, поэтому истёкшие всегда в начале
+PROBE_CACHE_TTL = 1.0
+_probe_cache: Dict[Tuple[str, int], Tuple[CheckResult, float]] = {}
+
+# SO_LINGER с нулевым таймаутом: close() сразу отправляет RST
+_LINGER_RESET = struct.pack("ii", 1, 0)
+
+
+def _remember_probe(key: Tuple[str, int], result: CheckResult, now: float):
+    """Запомнить успешную проверку и выбросить устаревшие (удалённые серверы, старые порты)"""
+    _probe_cache.pop(key, None)
+    _probe_cache[key] = (result, now + PROBE_CACHE_TTL)
+    
+    # Только что добавленная запись свежая, поэтому цикл на ней остановится
+    while True:
+        oldest = next(iter(_probe_cache))
+        if _probe_cache[oldest][1] > now:
+            break
+        del _probe_cache[oldest]
+
+
+async def _connect_any(addrs: List[Tuple[int, tuple]]) -> socket.socket:
+    """Подключиться к первому принявшему адресу, как open_connection(host, port)"""
+    loop = asyncio.get_running_loop()
+    error: Optional[OSError] = None
+    
+    # Хост с несколькими A/AAAA (или с неработающим IPv6) не должен падать из-за первого адреса
+    for family, sockaddr in addrs:
+        sock = _nonblocking_socket(family, socket.SOCK_STREAM)
+        try:
+            await loop.sock_connect(sock, sockaddr)
+        except OSError as e:
+            sock.close()
+            error = e
+        except BaseException:
+            sock.close()
+            raise
+        else:
+            return sock
+    
+    raise error
+
+
 async def check_tcp_port(host: str, port: int, timeout: int = 5) -> CheckResult:
     """Проверка TCP порта"""
-    start_time = datetime.now()
+    start_time = time.perf_counter()
+    
+    cached = _probe_cache.get((host, port))
+    if cached and cached[1] > start_time:
+        return cached[0]
     
+    sock = None
     try:
-        _, writer = await asyncio.wait_for(
-            asyncio.open_connection(host, port),
-            timeout=timeout
-        )
-        writer.close()
-        await writer.wait_closed()
+        # Подключаемся к уже известным IP, чтобы не резолвить имя каждый раунд.
+        # Голый неблокирующий connect: потоки asyncio для проверки не нужны
+        async with asyncio.timeout(timeout):
+            sock = await _connect_any(await resolve(host, port))
+        now = time.perf_counter()
+        
+        # Порт уже ответил: закрываем сбросом (RST) и не ждём FIN-ACK от сервера
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, _LINGER_RESET)
         
-        response_time = (datetime.now() - start_time).total_seconds() * 1000
-        return CheckResult(True, "tcp", response_time, None)
+        result = CheckResult(True, "tcp", (now - start_time) * 1000, None)
+        _remember_probe((host, port), result, now)
+        return result
         
     except asyncio.TimeoutError:
-        return CheckResult(False, "tcp", None, "Connection timeout")
+        return _TCP_TIMEOUT
     except ConnectionRefusedError:
-        return CheckResult(False, "tcp", None, "Connection refused")
+        return _TCP_REFUSED
     except OSError as e:
         return CheckResult(False, "tcp", None, f"OS Error: {e}")
     except Exception as e:
         return CheckResult(False, "tcp", None, str(e))
+    finally:
+        if sock is not None:
+            sock.close()
+
+
+# Параметры UDP-сокетов (Linux), модуль socket их не экспортирует:
+# - IP_MTU_DISCOVER / IPV6_MTU_DISCOVER = PMTUDISC_DONT: без флага DF датаграмма
+#   проверки фрагментируется, а не теряется за узлом, глотающим ICMP "need frag";
+# - IP_RECVERR / IPV6_RECVERR: ICMP-ошибки (port unreachable и т.п.) попадают
+#   в очередь ошибок сокета вместе с адресом, на который ушла датаграмма
+_UDP_SOCKOPTS: Dict[int, List[Tuple[int, int, int]]] = {
+    socket.AF_INET: [(socket.IPPROTO_IP, 10, 0), (socket.IPPROTO_IP, 11, 1)],
+    socket.AF_INET6: [(socket.IPPROTO_IPV6, 23, 0), (socket.IPPROTO_IPV6, 25, 1)],
+} if _IS_LINUX else {}
+
+# struct sock_extended_err начинается с errno причины
+_SOCK_EXTENDED_ERR = struct.Struct("=I")
+
+
+class _UdpProber:
+    """
+    Общий UDP-сокет для всех проверок одного семейства адресов.
+    Ответы и ICMP-ошибки раздаются ожидающим по адресу отправителя.
+    """
+    
+    def __init__(self, family: int, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.sock = _nonblocking_socket(family, socket.SOCK_DGRAM)
+        for option in _UDP_SOCKOPTS.get(family, ()):
+            self.sock.setsockopt(*option)
+        
+        self._waiters: Dict[Tuple[str, int], List[asyncio.Future]] = {}
+        # Свой reader вместо datagram endpoint: uvloop не передаёт протоколу
+        # ни ошибки отправки, ни ICMP-ошибки, а sock_recvfrom в нём нет
+        loop.add_reader(self.sock, self._on_readable)
+    
+    def _on_readable(self):
+        # Сначала очередь ошибок: пока она не пуста, сокет остаётся в POLLERR
+        # и reader вызывался бы снова, даже если датаграмм нет
+        errors = self._drain_errors()
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(1500)
+            except BlockingIOError:
+                break
+            except OSError:
+                # Ошибка без адреса; с IP_RECVERR адреса лежат в очереди ошибок
+                errors += 1 + self._drain_errors()
+                continue
+            
+            self._complete(addr[:2], data)
+        
+        if errors:
+            # libuv (uvloop) после POLLERR молча снимает сокет с опроса - ставим обратно
+            self.loop.remove_reader(self.sock)
+            self.loop.add_reader(self.sock, self._on_readable)
+    
+    def _drain_errors(self) -> int:
+        """Раздать ICMP-ошибки по адресам, куда ушли вызвавшие их датаграммы"""
+        drained = 0
+        while True:
+            try:
+                _, ancdata, _, addr = self.sock.recvmsg(1, 512, socket.MSG_ERRQUEUE)
+            except (OSError, AttributeError):
+                # Очередь пуста или MSG_ERRQUEUE не поддерживается платформой
+                return drained
+            
+            drained += 1
+            errno = next(
+                (_SOCK_EXTENDED_ERR.unpack_from(data)[0] for _, _, data in ancdata
+                 if len(data) >= _SOCK_EXTENDED_ERR.size),
+                0
+            )
+            if addr and errno:
+                self._complete(addr[:2], None, OSError(errno, os.strerror(errno)))
+    
+    def _complete(self, key: Tuple[str, int], data: Optional[bytes], error: Optional[OSError] = None):
+        for reply in self._waiters.pop(key, ()):
+            if reply.done():
+                continue
+            if error is None:
+                reply.set_result(data)
+            else:
+                reply.set_exception(error)
+    
+    async def exchange(self, sockaddr: tuple, payload: bytes, timeout: float) -> bytes:
+        """Отправить датаграмму и дождаться ответа с того же адреса"""
+        key = sockaddr[:2]
+        reply = self.loop.create_future()
+        self._waiters.setdefault(key, []).append(reply)
+        
+        try:
+            # UDP sendto на неблокирующем сокете не ждёт; ошибка маршрута - сразу OSError
+            self._send(payload, sockaddr)
+            async with asyncio.timeout(timeout):
+                return await reply
+        finally:
+            waiters = self._waiters.get(key)
+            if waiters and reply in waiters:
+                waiters.remove(reply)
+                if not waiters:
+                    del self._waiters[key]
+    
+    def _send(self, payload: bytes, sockaddr: tuple):
+        """sendto, не принимая на себя ICMP-ошибку чужой датаграммы"""
+        # Ядро возвращает из sendto отложенную ошибку сокета, а её вызвала
+        # датаграмма другой проверки. Очередь ошибок разбираем до отправки;
+        # если ошибка успела прийти в промежутке, она тоже в очереди - повторяем
+        self._drain_errors()
+        while True:
+            try:
+                self.sock.sendto(payload, sockaddr)
+                return
+            except OSError:
+                if not self._drain_errors():
+                    raise
+    
+    def close(self):
+        if not self.loop.is_closed():
+            self.loop.remove_reader(self.sock)
+        self.sock.close()
+
+
+_udp_probers: Dict[int, _UdpProber] = {}
+_UDP_PAYLOAD = b'\x00'
+
+
+def _get_udp_prober(family: int) -> _UdpProber:
+    """Общий UDP-сокет для семейства адресов в текущем event loop"""
+    loop = asyncio.get_running_loop()
+    prober = _udp_probers.get(family)
+    if prober is None or prober.loop is not loop:
+        if prober is not None:
+            prober.close()
+        prober = _udp_probers[family] = _UdpProber(family, loop)
+    return prober
 
 
 async def check_udp_port(host: str, port: int, timeout: int = 5) -> CheckResult:
     """Проверка UDP порта"""
-    start_time = datetime.now()
+    start_time = time.perf_counter()
+    # Общий бюджет на резолв и ожидание ответа: молчание засчитывается
+    # ровно к концу timeout, а не через timeout после резолва
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
     
     try:
-        loop = asyncio.get_event_loop()
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.setblocking(False)
+        async with asyncio.timeout_at(deadline):
+            addrs = await resolve(host, port)
         
-        await loop.run_in_executor(None, lambda: sock.sendto(b'\x00', (host, port)))
+        # Как и для TCP, перебираем адреса: ошибка отправки или ICMP unreachable -
+        # переходим к следующему, недоступность - только после последнего
+        for i, (family, sockaddr) in enumerate(addrs, 1):
+            try:
+                await _get_udp_prober(family).exchange(sockaddr, _UDP_PAYLOAD, deadline - loop.time())
+            except asyncio.TimeoutError:
+                # Многие UDP-сервисы молчат в ответ на пустой пакет - это не ошибка
+                break
+            except OSError:
+                if i == len(addrs):
+                    raise
+            else:
+                break
         
-        try:
-            await asyncio.wait_for(
-                loop.run_in_executor(None, lambda: sock.recvfrom(1024)),
-                timeout=timeout
-            )
-            response_time = (datetime.now() - start_time).total_seconds() * 1000
-            return CheckResult(True, "udp", response_time, None)
-        except asyncio.TimeoutError:
-            response_time = (datetime.now() - start_time).total_seconds() * 1000
-            return CheckResult(True, "udp", response_time, None)
-        finally:
-            sock.close()
+        response_time = (time.perf_counter() - start_time) * 1000
+        return CheckResult(True, "udp", response_time, None)
             
+    except asyncio.TimeoutError:
+        return _UDP_TIMEOUT
     except Exception as e:
         return CheckResult(False, "udp", None, str(e))
 
 
-async def check_server(host: str, port: int, protocol: str = "tcp") -> CheckResult:
-    """Проверка сервера"""
-    # Сначала ping
-    ping_result = await check_ping(host)
-    
-    if not ping_result.is_available:
-        return ping_result
-    
-    # Затем порт
+async def check_server(host: str, port: int, protocol: str = "tcp", timeout: float = 5) -> CheckResult:
+    """Проверка сервера по порту"""
+    # Без предварительного ping: многие хосты режут ICMP, а порт и так отвечает за доступность
     if protocol.lower() == "tcp":
-        return await check_tcp_port(host, port)
+        return await check_tcp_port(host, port, timeout)
     else:
-        return await check_udp_port(host, port)
\ No newline at end of file
+        return await check_udp_port(host, port, timeout)
+
+
+async def check_server_with_ping(host: str, port: int, protocol: str = "tcp", timeout: float = 5) -> CheckResult:
+    """Проверка сервера: ping и порт параллельно, недоступность по ping важнее"""
+    probe = check_tcp_port if protocol.lower() == "tcp" else check_udp_port
+    ping_task = asyncio.create_task(check_ping(host, timeout))
+    port_task = asyncio.create_task(probe(host, port, timeout))
+    
+    try:
+        await asyncio.wait((ping_task, port_task), return_when=asyncio.FIRST_COMPLETED)
+        
+        # Порт ответил раньше ping - это окончательный ответ
+        if port_task.done() and port_task.result().is_available:
+            return port_task.result()
+        
+        ping_result = await ping_task
+        if not ping_result.is_available:
+            return ping_result
+        
+        return await port_task
+    finally:
+        ping_task.cancel()
+        port_task.cancel()
+
+
+async def check_servers(targets: List[Tuple[str, int, str]], concurrency: int = 256) -> List[CheckResult]:
+    """Параллельная проверка списка (host, port, protocol), не больше concurrency одновременно"""
+    sem = asyncio.Semaphore(concurrency)
+    
+    async def _one(target: Tuple[str, int, str]) -> CheckResult:
+        async with sem:
+            return await check_server(*target)
+    
+    return await asyncio.gather(*(_one(t) for t in targets))
@@ -0,0 +1,87 @@
+import asyncio
+import socket
+import unittest
+
+import monitor
+
+
+class _Echo(asyncio.DatagramProtocol):
+    """UDP-сервис, отвечающий тем же пакетом"""
+    
+    def connection_made(self, transport):
+        self.transport = transport
+    
+    def datagram_received(self, data, addr):
+        self.transport.sendto(data, addr)
+
+
+def _closed_udp_port() -> int:
+    """Порт, который только что освободился: на него ядро ответит ICMP port unreachable"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@unittest.skipUnless(monitor._UDP_SOCKOPTS, "ICMP-ошибки UDP разбираются только на Linux")
+class UdpProbeTest(unittest.IsolatedAsyncioTestCase):
+    """Общий UDP-сокет: ICMP-ошибка одной цели не достаётся другой"""
+    
+    async def asyncSetUp(self):
+        loop = asyncio.get_running_loop()
+        self.echo, _ = await loop.create_datagram_endpoint(_Echo, local_addr=("127.0.0.1", 0))
+        self.open_port = self.echo.get_extra_info("sockname")[1]
+        self.closed_port = _closed_udp_port()
+    
+    async def asyncTearDown(self):
+        self.echo.close()
+        for prober in monitor._udp_probers.values():
+            prober.close()
+        monitor._udp_probers.clear()
+    
+    async def test_concurrent_closed_and_open_ports(self):
+        targets = [self.closed_port, self.open_port] * 5
+        results = await asyncio.gather(*(
+            monitor.check_udp_port("127.0.0.1", port, 2) for port in targets
+        ))
+        
+        for port, result in zip(targets, results):
+            if port == self.closed_port:
+                self.assertFalse(result.is_available)
+                self.assertIn("refused", result.error)
+            else:
+                self.assertTrue(result.is_available)
+                # Ответ эхо-сервиса, а не молчание до таймаута
+                self.assertLess(result.response_time, 1000)
+    
+    async def test_alternating_closed_and_open_ports(self):
+        for _ in range(3):
+            closed = await monitor.check_udp_port("127.0.0.1", self.closed_port, 2)
+            opened = await monitor.check_udp_port("127.0.0.1", self.open_port, 2)
+            
+            self.assertFalse(closed.is_available)
+            self.assertTrue(opened.is_available)
+            self.assertLess(opened.response_time, 1000)
+
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+@unittest.skipIf(uvloop is None, "uvloop не установлен")
+class UvloopUdpProbeTest(UdpProbeTest):
+    """То же под uvloop: libuv снимает сокет с опроса после POLLERR"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls._policy = asyncio.get_event_loop_policy()
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    
+    @classmethod
+    def tearDownClass(cls):
+        asyncio.set_event_loop_policy(cls._policy)
+
+
+if __name__ == "__main__":
+    unittest.main()